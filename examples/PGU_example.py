@@ -8,7 +8,7 @@ from pylptlib import param
 # from ProxyClass import Proxy
 # tcp_ip = "192.168.0.4"
 # lpt = Proxy(tcp_ip, 8888, "lpt")
-# param = Proxy(tcp_ip, 8888, "param")
+# param = Proxy(tcp_ip, 8888, "param", snapshot=True)
 
 lpt.initialize()
 lpt.tstsel(1)
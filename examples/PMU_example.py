@@ -1,5 +1,3 @@
-import time
-
 # Option1: when script runs on the 4200-SCS
 from pylptlib import lpt, param
 
@@ -7,7 +5,7 @@ from pylptlib import lpt, param
 # from ProxyClass import Proxy
 # tcp_ip = "192.168.0.4"
 # lpt = Proxy(tcp_ip, 8888, "lpt")
-# param = Proxy(tcp_ip, 8888, "param")
+# param = Proxy(tcp_ip, 8888, "param", snapshot=True)
 
 lpt.initialize()
 lpt.tstsel(1)
@@ -91,15 +89,9 @@ for channel in channels:
 
 lpt.pulse_exec(mode=1)
 
-while True:
-    time.sleep(0.1)
-    status, elapsed_time = lpt.pulse_exec_status()
-    print("Execution status:", status, "Time elapsed:", elapsed_time)
-
-    if status != param.PMU_TEST_STATUS_RUNNING:
-        break
-    if elapsed_time > timeout:
-        lpt.dev_abort()
+# returns as soon as the test has finished, or aborts it with dev_abort after the timeout
+status, elapsed_time = lpt.pulse_exec_wait(timeout)
+print("Execution status:", status, "Time elapsed:", elapsed_time)
 
 for channel in channels:
 
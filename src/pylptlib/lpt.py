@@ -20,8 +20,12 @@
 from __future__ import annotations
 
 import ctypes as c
+import sys
+import time
+from collections import OrderedDict
 
 from .error_codes import ERROR_CODES
+from . import param
 
 # By standard the lptlib.dll is imported from the default Clarius installation path at C:\s4200\sys\bin\lptlib.dll
 # Alternatively, the lptlib.dll can be copied to the working directory of this script or the directory of the server.exe
@@ -132,6 +136,15 @@ def check_error(error_code: c.c_int32, *args):
         raise K4200Error(error_string)
 
 
+_scan_buffers: list = []
+"""Arrays that were handed to the dll by smeasX commands. The dll writes into them during the next sweep, so they are
+kept alive here until the scan tables are cleared with clrscn, independent of the references held by the caller."""
+
+
+def _register_scan_buffers(*buffers):
+    _scan_buffers.extend(buffers)
+
+
 def initialize():
     """Load the library with ctypes."""
     global _dll
@@ -163,6 +176,7 @@ def clrscn() -> None:
     """This command clears the measurement scan tables associated with a sweep."""
     err = _dll.clrscn()
     check_error(err)
+    _scan_buffers.clear()
 
 
 def getinstid(id_string: str):
@@ -602,6 +616,26 @@ def pulse_exec_status() -> tuple[int, float]:
     return int(status), float(elapsed_time.value)
 
 
+def pulse_exec_wait(timeout: float | None = None, max_interval: float = 0.02) -> tuple[int, float]:
+    """Wait until the test started with pulse_exec is no longer running and return the final pulse_exec_status.
+
+    The status is polled every millisecond at first. For longer tests, the interval grows with the elapsed time up to
+    max_interval (in seconds), so the wait ends shortly after the test without flooding the DLL with calls.
+    If the test is still running after timeout seconds, it is aborted with dev_abort and a TimeoutError is raised.
+    """
+    interval = 0.001
+    while True:
+        status, elapsed_time = pulse_exec_status()
+        if status != param.PMU_TEST_STATUS_RUNNING:
+            return status, elapsed_time
+        if timeout is not None and elapsed_time > timeout:
+            dev_abort()
+            msg = f"The pulse test was aborted, because it was still running after {elapsed_time:.3f} s."
+            raise TimeoutError(msg)
+        time.sleep(interval)
+        interval = min(max_interval, max(interval, elapsed_time * 0.05))
+
+
 def pulse_fetch(instr_id: int, chan: int, start_index: int, stop_index: int) -> tuple[list, list, list, list]:
     """This command retrieves enabled test data and temporarily stores it in the data buffer.
 
@@ -646,6 +680,22 @@ def pulse_fetch(instr_id: int, chan: int, start_index: int, stop_index: int) ->
     return meas_v, meas_i, timestamp, statuses
 
 
+def pulse_fetch_chunks(instr_id: int, chan: int, start_index: int, stop_index: int, chunk_size: int = 65536):
+    """Retrieve the test data like pulse_fetch, but in chunks of at most chunk_size points.
+
+    This is a generator that yields a tuple of voltages, currents, timestamps and statuses per chunk. Each chunk is
+    only fetched when the next one is requested, so long waveforms can be processed without holding all of them in
+    memory. The tcp_server streams the chunks to the client.
+
+    indices as in python: for 50 use 0 and 49
+    """
+    if chunk_size < 1:
+        msg = f"The chunk size must be positive, not {chunk_size}."
+        raise ValueError(msg)
+    for chunk_start in range(start_index, stop_index + 1, chunk_size):
+        yield pulse_fetch(instr_id, chan, chunk_start, min(chunk_start + chunk_size - 1, stop_index))
+
+
 def pulse_float(instr_id: int, chan: int, state: bool):
     """Set the state of the floating relay for the given pulse instrument."""
     err = _dll.pulse_float(c.c_int32(instr_id), c.c_int32(chan), c.c_int32(state))
@@ -1198,6 +1248,7 @@ def smeasf(instr_id: int, array_size: int) -> list[float]:
 
     err = _dll.smeasf(c_instr_id, c.byref(c_freqs))
     check_error(err)
+    _register_scan_buffers(c_freqs)
 
     # TODO: convert c_frequs to list
     return c_freqs
@@ -1211,6 +1262,7 @@ def smeasfRT(instr_id: int, array_size: int, column_name: str) -> list[float]:
 
     err = _dll.smeasfRT(c_instr_id, c.byref(c_freqs), c_column_name)
     check_error(err)
+    _register_scan_buffers(c_freqs)
 
     # TODO: convert c_frequs to list
     return c_freqs
@@ -1223,6 +1275,7 @@ def smeass(instr_id: int, array_size: int) -> list[float]:
 
     err = _dll.smeass(c_instr_id, c.byref(c_status_array))
     check_error(err)
+    _register_scan_buffers(c_status_array)
 
     # TODO: Check status codes
     return c_status_array
@@ -1235,6 +1288,7 @@ def smeast(timer_id: str, array_size: int) -> list[float]:
 
     err = _dll.smeast(c_timer_id, c.byref(c_timestamps))
     check_error(err)
+    _register_scan_buffers(c_timestamps)
 
     return c_timestamps
 
@@ -1247,6 +1301,7 @@ def smeastRT(timer_id: int, array_size: int, column_name: str) -> list[float]:
 
     err = _dll.smeastRT(c_timer_id, c.byref(c_timestamps), c_column_name)
     check_error(err)
+    _register_scan_buffers(c_timestamps)
 
     return c_timestamps
 
@@ -1258,6 +1313,7 @@ def smeasv(instr_id: int, array_size: int) -> list[float]:
 
     err = _dll.smeasv(c_instr_id, c.byref(c_voltages))
     check_error(err)
+    _register_scan_buffers(c_voltages)
 
     return c_voltages
 
@@ -1270,6 +1326,7 @@ def smeasvRT(instr_id: int, array_size: int, column_name: str) -> list[float]:
 
     err = _dll.smeasvRT(c_instr_id, c.byref(c_voltages), c_column_name)
     check_error(err)
+    _register_scan_buffers(c_voltages)
 
     return c_voltages
 
@@ -1281,6 +1338,7 @@ def smeasi(instr_id: int, array_size: int) -> list[float]:
 
     err = _dll.smeasi(c_instr_id, c.byref(c_currents))
     check_error(err)
+    _register_scan_buffers(c_currents)
 
     return c_currents
 
@@ -1297,6 +1355,7 @@ def smeasz(instr_id: int, model: int, speed: int, array_size: int) -> (list[floa
 
     err = _dll.smeasz(c_instr_id, c_model, c_speed, c.byref(meas_result1), c.byref(meas_result2))
     check_error(err)
+    _register_scan_buffers(meas_result1, meas_result2)
 
     return meas_result1, meas_result2.value
 
@@ -1319,6 +1378,7 @@ def smeaszRT(
 
     err = _dll.smeaszRT(c_instr_id, c_model, c_speed, c.byref(meas_result1), c.byref(meas_result2), c_column_name)
     check_error(err)
+    _register_scan_buffers(meas_result1, meas_result2)
 
     return meas_result1, meas_result2.value
 
@@ -1365,13 +1425,78 @@ def sweepv(instr_id: int, start_freq: float, stop_freq: float, number_of_points:
 # defined for each channel by using smeasX commands and the actual measurement is started by a sweepX command. In this
 # case, the following functions can be used to save the result arrays in a global dictionary and read them out later.
 
-_measurements: dict = {}
-"""Dictionary to save result arrays for later readout after measurement has been finished."""
+_measurements: OrderedDict = OrderedDict()
+"""Dictionary to save result arrays for later readout after measurement has been finished. Ordered from least to most
+recently used."""
+
+_measurement_info: dict = {}
+"""Size in bytes and time of last use of each entry in _measurements."""
+
+_evicted_measurements: OrderedDict = OrderedDict()
+"""Keys of evicted measurements with the reason of eviction. Only the most recent _evicted_measurements_limit keys are
+remembered."""
+
+_evicted_measurements_limit = 10000
+
+_measurement_cache_limits = {"max_bytes": None, "ttl": None}
+
+
+def set_measurement_cache_limits(max_bytes: int | None = None, ttl: float | None = None):
+    """Limit the memory used by prepared measurements.
+
+    If the total size exceeds max_bytes, the least recently used measurements are evicted. Measurements that were not
+    used for more than ttl seconds are evicted as well. None disables the respective limit. Arrays of a sweep that has
+    not been cleared with clrscn yet are kept alive for the dll, even if their measurement has been evicted.
+    """
+    _measurement_cache_limits["max_bytes"] = max_bytes
+    _measurement_cache_limits["ttl"] = ttl
+    _evict_measurements()
+
+
+def measurement_cache_size() -> int:
+    """Return the memory in bytes used by the prepared measurements."""
+    return sum(size for size, _ in _measurement_info.values())
+
+
+def _measurement_size(result) -> int:
+    if isinstance(result, (tuple, list)):
+        return sum(_measurement_size(element) for element in result)
+    try:
+        return c.sizeof(result)
+    except TypeError:
+        return sys.getsizeof(result)
+
+
+def _evict_measurement(key: str, reason: str):
+    del _measurements[key]
+    del _measurement_info[key]
+    _evicted_measurements[key] = reason
+    if len(_evicted_measurements) > _evicted_measurements_limit:
+        _evicted_measurements.popitem(last=False)
+
+
+def _evict_measurements():
+    ttl = _measurement_cache_limits["ttl"]
+    if ttl is not None:
+        oldest_allowed = time.monotonic() - ttl
+        for key in [key for key, (_, last_use) in _measurement_info.items() if last_use < oldest_allowed]:
+            _evict_measurement(key, f"it was not used for more than {ttl} s")
+
+    max_bytes = _measurement_cache_limits["max_bytes"]
+    if max_bytes is not None:
+        size = measurement_cache_size()
+        # the most recently prepared measurement is kept, even if it exceeds the limit on its own
+        while size > max_bytes and len(_measurements) > 1:
+            key = next(iter(_measurements))
+            size -= _measurement_info[key][0]
+            _evict_measurement(key, f"the cache limit of {max_bytes} bytes was exceeded")
 
 
 def reset_measurement_cache():
     """Reset the _measurements dictionary for a new set of data."""
     _measurements.clear()
+    _measurement_info.clear()
+    _evicted_measurements.clear()
 
     # Clear the measurement tables of the device
     clrscn()
@@ -1383,12 +1508,22 @@ def prepare_measurement(function_name: str, key: str, *args, **kwargs):
     result = function(*args, **kwargs)
     # save the array reference in a global dictionary
     _measurements[key] = result
+    _measurements.move_to_end(key)
+    _measurement_info[key] = (_measurement_size(result), time.monotonic())
+    _evicted_measurements.pop(key, None)
+    _evict_measurements()
     return result
 
 
 def read_measurement(key: str):
     """Read out the data from a previous measurement."""
+    _evict_measurements()
+    if key not in _measurements and key in _evicted_measurements:
+        msg = f"The measurement {key!r} has been evicted from the cache, because {_evicted_measurements[key]}."
+        raise KeyError(msg)
     result = _measurements[key]
+    _measurements.move_to_end(key)
+    _measurement_info[key] = (_measurement_info[key][0], time.monotonic())
     if isinstance(result, c.Array):
         pointer = c.cast(result, c.POINTER(c.c_double))
         result = [pointer[i] for i in range(len(result))]
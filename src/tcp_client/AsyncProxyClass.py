@@ -0,0 +1,461 @@
+import json
+import asyncio
+import logging
+import socket
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Optional, Sequence, Tuple
+
+from .ProxyClass import (MESSAGE_LIMIT, SESSION, CompressionStatistics, ProxyBase, apply_deadline, build_signature,
+                         check_arguments, check_compression, check_framing, connection_closed, describe_stub,
+                         frame_message, negotiate_framing, read_message, take_released)
+
+
+logger = logging.getLogger("TCPClientProxy")
+
+
+class AsyncConnection:
+    """
+    A single TCP connection to the tcp_server that can be used by several coroutines at the same time.
+
+    The connection is opened with the first request. Requests are sent with an id and a background task dispatches the
+    responses to the waiting coroutines. If the connection was closed in the meantime, it is re-established with the
+    next request. Servers without support for the handshake close the connection after each response, each request
+    then gets a connection of its own.
+
+    compression is a codec name or a list of codec names ("zlib", "lzma") in order of preference. The server compresses
+    large responses with the first of them it supports.
+
+    With framing "length", the connection is switched to length-prefixed frames after it was opened, see Proxy.
+    """
+
+    def __init__(self, address: str, port: int, compression: Optional[Sequence[str]] = None, framing: str = "line"):
+        self.address = address
+        self.port = port
+        self.compression = check_compression(compression)
+        self.framing = check_framing(framing)
+        # the framing that was negotiated for the current connection
+        self._framing = "line"
+        # whether the server keeps connections open for further requests, None until the first handshake
+        self._keeps_connections: Optional[bool] = None
+        self.compression_statistics = CompressionStatistics()
+        self.session = SESSION
+        # names of released RemoteVars that are sent along with the next request
+        self.release_queue: Deque[str] = deque()
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._read_task: Optional[asyncio.Task] = None
+        self._connect_lock: Optional[asyncio.Lock] = None
+        self._write_lock: Optional[asyncio.Lock] = None
+        self._request_count = 0
+        # futures of the requests that are waiting for their response, in the order they were sent
+        self._futures: Dict[int, asyncio.Future] = {}
+        # queues that receive the chunks of the streams, by request id
+        self._chunks: Dict[int, asyncio.Queue] = {}
+
+    # maximum number of chunks of a stream that are received before they are consumed, further responses are only
+    # read once the consumer catches up
+    max_buffered_chunks = 4
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def connect(self):
+        """Open the connection if it is not open yet."""
+        if self._connect_lock is None:
+            # the locks are created here to bind them to the loop of the caller
+            self._connect_lock = asyncio.Lock()
+            self._write_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self._writer is not None or self._keeps_connections is False:
+                return
+            reader, writer = await self._open()
+            if self._keeps_connections is None or self.framing != "line":
+                framing = await negotiate_framing(reader, writer, self.framing)
+                self._keeps_connections = framing is not None
+                if framing is None:
+                    # servers without support for the handshake close the connection after answering it
+                    writer.close()
+                    return
+                self._framing = framing
+            self._reader, self._writer = reader, writer
+            self._read_task = asyncio.ensure_future(self._read_responses(self._reader, self._framing))
+
+    async def _open(self) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        reader, writer = await asyncio.open_connection(self.address, self.port, limit=MESSAGE_LIMIT)
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return reader, writer
+
+    async def close(self):
+        """Close the connection. Requests that are still waiting for their response fail."""
+        writer, read_task = self._writer, self._read_task
+        self._reader = None
+        self._writer = None
+        self._read_task = None
+        if read_task is not None:
+            read_task.cancel()
+        if writer is not None:
+            writer.close()
+            # StreamWriter.wait_closed was added in Python 3.7
+            if hasattr(writer, "wait_closed"):
+                try:
+                    await writer.wait_closed()
+                except (ConnectionError, OSError):
+                    pass
+        self._fail_pending(ConnectionResetError("The connection was closed before the response was received."))
+
+    def _fail_pending(self, exception: BaseException):
+        futures, self._futures = self._futures, {}
+        for future in futures.values():
+            if not future.done():
+                future.set_exception(exception)
+
+    async def _read_responses(self, reader: asyncio.StreamReader, framing: str):
+        try:
+            while True:
+                data, binary = await read_message(reader, framing)
+                logger.debug("Response: %s", data)
+                response = self.compression_statistics.decode_response(data, binary)
+                # servers that do not support request ids answer in order
+                request_id = response.get("id", next(iter(self._futures), None))
+                if "chunk" in response:
+                    chunks = self._chunks.get(request_id)
+                    if chunks is not None:
+                        await chunks.put(response)
+                    continue
+                future = self._futures.pop(request_id, None)
+                if future is not None and not future.done():
+                    future.set_result(response)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if reader is self._reader:
+                self._reader = None
+                self._writer.close()
+                self._writer = None
+                self._read_task = None
+            self._fail_pending(e)
+
+    async def _exchange(self, command_json: Dict[str, Any], chunks: Optional[asyncio.Queue] = None) -> Dict[str, Any]:
+        if self._writer is not None and not self._futures and connection_closed(self._reader, self._writer):
+            # the connection went stale, e.g. because the server was restarted, and the reader has not noticed yet
+            logger.debug("Connection closed by the server, reconnecting.")
+            await self.close()
+        await self.connect()
+        self._request_count += 1
+        request_id = self._request_count
+        command_json = dict(command_json, id=request_id, session=self.session)
+        if self.compression:
+            command_json["compression"] = self.compression
+        if self.release_queue:
+            command_json["release"] = take_released(self.release_queue)
+        apply_deadline(command_json)
+        command = json.dumps(command_json)
+        logger.debug("Request: %s", command)
+        if not self._keeps_connections:
+            return await self._exchange_once(command)
+        future = asyncio.get_running_loop().create_future()
+        self._futures[request_id] = future
+        if chunks is not None:
+            self._chunks[request_id] = chunks
+        try:
+            async with self._write_lock:
+                self._writer.write(frame_message(command.encode("utf-8"), self._framing))
+                await self._writer.drain()
+            return await future
+        finally:
+            self._futures.pop(request_id, None)
+            self._chunks.pop(request_id, None)
+
+    async def _exchange_once(self, command: str) -> Dict[str, Any]:
+        # servers without support for the handshake answer a single request per connection
+        reader, writer = await self._open()
+        try:
+            writer.write(frame_message(command.encode("utf-8"), "line"))
+            await writer.drain()
+            data, binary = await read_message(reader, "line")
+        finally:
+            writer.close()
+        logger.debug("Response: %s", data)
+        return self.compression_statistics.decode_response(data, binary)
+
+    async def request(self, command_json: Dict[str, Any]) -> Dict[str, Any]:
+        """Send a command to the server and return the decoded response.
+
+        A command is never repeated, as the server may have executed it even if the connection fails before the
+        response is received.
+        """
+        return await self._exchange(command_json)
+
+    async def stream(self, command_json: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        """Send a command with "stream" and yield the decoded messages with its chunks, followed by the final response.
+
+        The stream gets a connection of its own, so that its chunks do not hold back the responses of other requests
+        that are awaited during the iteration. If the iteration is stopped early, the remaining chunks sent by the
+        server are discarded.
+        """
+        connection = AsyncConnection(self.address, self.port, self.compression, self.framing)
+        connection.session = self.session
+        connection.release_queue = self.release_queue
+        connection.compression_statistics = self.compression_statistics
+        connection._keeps_connections = self._keeps_connections
+        chunks: asyncio.Queue = asyncio.Queue(self.max_buffered_chunks)
+        exchange = asyncio.ensure_future(connection._exchange(command_json, chunks))
+        chunk = None
+        try:
+            while True:
+                chunk = asyncio.ensure_future(chunks.get())
+                await asyncio.wait([chunk, exchange], return_when=asyncio.FIRST_COMPLETED)
+                if chunk.done():
+                    yield chunk.result()
+                    continue
+                chunk.cancel()
+                # the final response is read after all chunks
+                while not chunks.empty():
+                    yield chunks.get_nowait()
+                yield exchange.result()
+                return
+        finally:
+            exchange.cancel()
+            if chunk is not None:
+                chunk.cancel()
+            # unblock the reading of the responses if it waits for space in the queue
+            while not chunks.empty():
+                chunks.get_nowait()
+            await connection.close()
+
+
+class AsyncJob:
+    """
+    A function call that the server runs in the background, started with AsyncProxy.start_job. See Job.
+    """
+
+    def __init__(self, proxy: "AsyncProxy", job_id: str):
+        self._proxy = proxy
+        self.job_id = job_id
+        # "collected" or "cancelled" once the job is no longer kept by the server
+        self._final_status: Optional[str] = None
+        self._result = None
+
+    async def _request(self, action: str, **fields) -> Dict[str, Any]:
+        return await self._proxy._connection.request(dict(fields, job_id=self.job_id, action=action))
+
+    async def status(self) -> str:
+        """Return the status of the job at the server: "queued", "running", "done" or "failed".
+
+        Once the result was collected or the job was cancelled, "collected" or "cancelled" is returned locally.
+        """
+        if self._final_status is not None:
+            return self._final_status
+        response = self._proxy.check_result(await self._request("status"))
+        return self._proxy._convert_argument_from_json(response["return"])
+
+    async def done(self) -> bool:
+        """Return True if the job has finished or was cancelled."""
+        return await self.status() not in ("queued", "running")
+
+    async def cancel(self, abort: Optional[str] = None) -> bool:
+        """Cancel the job if it has not been started yet, and return whether it was cancelled.
+
+        A running job is ended by calling the function abort of the target, e.g. "dev_abort", and is then cancelled
+        as well.
+        """
+        if self._final_status is not None:
+            return False
+        fields = {} if abort is None else {"abort": abort, "class": self._proxy._target_class}
+        response = self._proxy.check_result(await self._request("cancel", **fields))
+        cancelled = self._proxy._convert_argument_from_json(response["return"])
+        if cancelled:
+            self._final_status = "cancelled"
+        return cancelled
+
+    async def result(self, timeout: Optional[float] = None):
+        """Wait until the job has finished, at most timeout seconds, and return its result or raise its exception.
+
+        If the job has not finished within the timeout, a TimeoutError is raised and the job continues.
+        """
+        if self._final_status is None:
+            fields = {} if timeout is None else {"timeout": timeout}
+            response = await self._request("result", **fields)
+            if "job_status" in response:
+                raise TimeoutError(f"The job {self.job_id} is still {response['job_status']}.")
+            # convert only once, so that each RemoteVar of the result exists a single time
+            self._final_status = "collected"
+            try:
+                self._result = self._proxy._convert_argument_from_json(self._proxy.check_result(response)["return"])
+            except BaseException as e:
+                self._result = e
+        if isinstance(self._result, BaseException):
+            raise self._result
+        return self._result
+
+
+class AsyncProxy(ProxyBase):
+    """
+    Asynchronous client-side stand-in for an object served by the tcp_server.
+
+    All functions of the target are coroutines that run in the event loop of the caller:
+
+        lpt = AsyncProxy("192.168.0.4", 8888, "lpt")
+        param = lpt.target("param")
+        await lpt.rpm_config(card_id, 1, await param.get_attribute("KI_RPM_PATHWAY"), 0)
+
+    Proxies created with target() share the connection, and concurrent calls are multiplexed on it. As an attribute
+    access cannot be awaited, every public name is treated as function of the target. Constants are read with
+    get_attribute or fetched all at once with load_snapshot or load_stubs.
+    """
+
+    def __init__(self, address: str, port: int, target_class: str, connection: Optional[AsyncConnection] = None,
+                 compression: Optional[Sequence[str]] = None, framing: str = "line"):
+        self._target_class = target_class
+        self._connection = connection or AsyncConnection(address, port, compression, framing)
+
+    async def __aenter__(self):
+        await self._connection.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    @property
+    def compression_statistics(self) -> CompressionStatistics:
+        return self._connection.compression_statistics
+
+    @property
+    def _release_queue(self) -> Deque[str]:
+        return self._connection.release_queue
+
+    def target(self, target_class: str) -> "AsyncProxy":
+        """Return a proxy for another served object that uses the same connection."""
+        return AsyncProxy(self._connection.address, self._connection.port, target_class, self._connection)
+
+    async def close(self):
+        """Close the connection, also for all proxies sharing it."""
+        await self._connection.close()
+
+    async def get_attribute(self, name: str):
+        """Return the value of an attribute of the target."""
+        result_json = self.check_result(await self._connection.request({
+            "class": self._target_class,
+            "attribute": name
+        }))
+        return self._convert_argument_from_json(result_json["return"])
+
+    async def repeat(self, function: str, count: int, *args, interval: Optional[float] = None, **kwargs):
+        """Call a function of the target count times with the same arguments in a single request.
+
+        Return the results and the host times of the server (seconds since the epoch) at which the calls were
+        started. With interval (in seconds), the calls are started at this fixed rate.
+        """
+        command_json = self._make_repeat_command(function, count, interval, args, kwargs)
+        result_json = self.check_result(await self._connection.request(command_json))
+        values, timestamps = self._convert_argument_from_json(result_json["return"])
+        return values, timestamps
+
+    async def stream(self, function: str, *args, chunk_size: Optional[int] = None, **kwargs) -> AsyncIterator:
+        """Call a function of the target and iterate over the chunks of its result as they arrive, see Proxy.stream:
+
+            async for voltages, currents, times, statuses in lpt.stream("pulse_fetch_chunks", card_id, 1, 0, 999999):
+                ...
+        """
+        command_json = self._make_stream_command(function, chunk_size, args, kwargs)
+        async for response in self._connection.stream(command_json):
+            for chunk in self._convert_stream_message(response):
+                yield chunk
+
+    async def wait_while(self, value, function: str, *args, item: Optional[int] = None,
+                         timeout: Optional[float] = None, abort: Optional[str] = None, **kwargs):
+        """Let the server call a function of the target until its result (or its element item) differs from value,
+        and return the last result, see Proxy.wait_while."""
+        command_json = self._make_poll_command(value, function, item, timeout, abort, args, kwargs)
+        result_json = self.check_result(await self._connection.request(command_json))
+        return self._convert_argument_from_json(result_json["return"])
+
+    async def start_job(self, function: str, *args, **kwargs) -> AsyncJob:
+        """Let the server call a function of the target in the background and return the AsyncJob right away.
+
+        Unlike a call that is awaited, the job keeps running on the server if the caller is cancelled, and its result
+        can be collected later, see Job.
+        """
+        command_json = self._make_call_command(function, args, kwargs)
+        command_json["job"] = True
+        result_json = self.check_result(await self._connection.request(command_json))
+        return AsyncJob(self, self._convert_argument_from_json(result_json["return"]))
+
+    async def flush_releases(self):
+        """Send the names of released RemoteVars to the server right away instead of with the next request."""
+        if self._release_queue:
+            self.check_result(await self._connection.request({}))
+
+    @asynccontextmanager
+    async def instrument_lock(self):
+        """Return an async context manager that reserves the instrument for the session of this client.
+
+        Within the async with block, the calls of other clients are held back by the server.
+        """
+        self.check_result(await self._connection.request({"lock": True}))
+        try:
+            yield self
+        finally:
+            self.check_result(await self._connection.request({"lock": False}))
+
+    async def server_metrics(self) -> Dict[str, Any]:
+        """Return the metrics of the server, e.g. the call counts and execution times of the served functions."""
+        return self.check_result(await self._connection.request({"metrics": True}))["return"]
+
+    async def load_snapshot(self):
+        """Fetch all constants of the target from the server and store them as local attributes."""
+        result_json = self.check_result(await self._connection.request({
+            "class": self._target_class,
+            "namespace": True
+        }))
+        for name, value in result_json["return"].items():
+            self.__dict__[name] = self._convert_argument_from_json(value)
+
+    async def load_stubs(self, schema: Optional[Dict[str, Any]] = None):
+        """Create local coroutine stubs for all functions of the target and store all its constants as attributes.
+
+        The schema is fetched from the server with one request if it is not given. The stubs check the arguments
+        against the signatures of the served functions before sending a call.
+        """
+        if schema is None:
+            result_json = self.check_result(await self._connection.request({
+                "class": self._target_class,
+                "schema": True
+            }))
+            schema = result_json["return"][self._target_class]
+        for name, value in schema["constants"].items():
+            self.__dict__[name] = self._convert_argument_from_json(value)
+        for name, spec in schema["functions"].items():
+            self.__dict__[name] = self._make_stub(name, spec)
+
+    def _make_stub(self, function: str, spec: Dict[str, Any]) -> Callable:
+        signature = build_signature(spec)
+
+        async def stub(*args, **kwargs):
+            check_arguments(function, signature, args, kwargs)
+            return await self._call(function, args, kwargs)
+
+        describe_stub(stub, function, spec, signature)
+        return stub
+
+    async def _call(self, function: str, args, kwargs):
+        command_json = self._make_call_command(function, args, kwargs)
+        result_json = self.check_result(await self._connection.request(command_json))
+        return self._convert_argument_from_json(result_json["return"])
+
+    def __getattr__(self, function):
+        if function[0] == "_":
+            raise AttributeError(function)
+
+        async def handle_call(*args, **kwargs):
+            return await self._call(function, args, kwargs)
+
+        self.__dict__[function] = handle_call
+        return handle_call
@@ -1,7 +1,23 @@
+import abc
+import array
+import base64
+import bisect
+import inspect
 import json
 import builtins
 import asyncio
 import logging
+import select
+import socket
+import struct
+import sys
+import threading
+import time
+import uuid
+import zlib
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, Optional, Sequence, Tuple
 
 # As SweepMe! 1.5.5 does not come with tblib, we only use it
 # if it is available
@@ -11,11 +27,350 @@ try:
 except ModuleNotFoundError:
     tblib_imported = False
     
+# numpy is optional and only needed if arrays shall be returned as numpy arrays
+try:
+    import numpy
+    numpy_imported = True
+except ModuleNotFoundError:
+    numpy_imported = False
+
 from six import reraise
 
+# contextvars is only available from Python 3.7 on. Before, deadlines are kept per thread, which is the same for the
+# synchronous proxies, the asynchronous ones need Python 3.7 anyway.
+try:
+    import contextvars
+    contextvars_imported = True
+except ModuleNotFoundError:
+    contextvars_imported = False
+
+
+# lzma is missing in some Python builds, zlib is always available
+try:
+    import lzma
+    lzma_imported = True
+except ModuleNotFoundError:
+    lzma_imported = False
+
 
 logger = logging.getLogger("TCPClientProxy")
 
+# maximum length of a single message, the default limit of asyncio streams (64 KiB) is too small for waveform data
+MESSAGE_LIMIT = 2 ** 28
+
+DECOMPRESSORS = {"zlib": zlib.decompress}
+"""Codecs that can be requested for the compression of responses."""
+if lzma_imported:
+    DECOMPRESSORS["lzma"] = lzma.decompress
+
+# Version 1 are newline-delimited JSON messages. Version 2 adds the handshake, with which a client can switch its
+# connection to length-prefixed frames.
+PROTOCOL_VERSION = 2
+FRAMINGS = ("line", "length")
+
+FRAME_HEADER = struct.Struct("!II")
+"""Header of a length-prefixed frame: the lengths of the JSON part and of the binary part that follow it. The
+binary part contains the data of the packed arrays of a response."""
+
+SESSION = uuid.uuid4().hex
+"""Name of the session of this process at the server. All proxies of a process share the objects referenced by their
+RemoteVars and the instrument lock, while other clients have their own."""
+
+class ThreadLocalVar(threading.local):
+    """The part of contextvars.ContextVar that is used for DEADLINE, with a value per thread."""
+
+    def __init__(self, name: str, default=None):
+        self.name = name
+        self.value = default
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        token = self.value
+        self.value = value
+        return token
+
+    def reset(self, token):
+        self.value = token
+
+
+if contextvars_imported:
+    DEADLINE = contextvars.ContextVar("DEADLINE", default=None)
+else:
+    DEADLINE = ThreadLocalVar("DEADLINE", default=None)
+"""The time.monotonic() until which the requests of the current context have to be started by the server, and the
+name of the function that aborts them, see deadline."""
+
+
+@contextmanager
+def deadline(seconds: float, abort: Optional[str] = None):
+    """Return a context manager that limits the time of all requests sent within it, by all proxies of the thread
+    or task:
+
+        with deadline(10, abort="dev_abort"):
+            lpt.pulse_exec(0)
+            lpt.pulse_exec_wait()
+
+    Each request carries the remaining time. The server drops calls that are still queued when it has passed, without
+    calling the served object, and answers with a TimeoutError. If abort names a function of the target, the server
+    calls it when a call is still running at the deadline, e.g. dev_abort to end a running pulse test. Nested
+    deadlines can only shorten the time.
+    """
+    end = time.monotonic() + seconds
+    outer = DEADLINE.get()
+    if outer is not None:
+        end = min(end, outer[0])
+        abort = abort or outer[1]
+    token = DEADLINE.set((end, abort))
+    try:
+        yield
+    finally:
+        DEADLINE.reset(token)
+
+
+def apply_deadline(command_json: Dict[str, Any]):
+    """Add the remaining time of the deadline of the current context to a command."""
+    current = DEADLINE.get()
+    if current is None:
+        return
+    end, abort = current
+    # a passed deadline is still sent, the server then rejects the request without executing it
+    command_json["deadline"] = max(end - time.monotonic(), 0.0)
+    if abort is not None:
+        command_json["abort"] = abort
+
+
+class LatencyHistogram:
+    """
+    Distribution of durations in logarithmic buckets together with their count, sum, minimum and maximum.
+    """
+
+    # upper bounds of the buckets in s, durations above the last bound are counted in an overflow bucket
+    bounds = (1e-5, 2e-5, 5e-5, 1e-4, 2e-4, 5e-4, 1e-3, 2e-3, 5e-3, 1e-2, 2e-2, 5e-2, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0,
+              10.0)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def add(self, duration: float):
+        self.counts[bisect.bisect_left(self.bounds, duration)] += 1
+        self.count += 1
+        self.total += duration
+        self.min = min(self.min, duration)
+        self.max = max(self.max, duration)
+
+    def snapshot(self) -> Dict[str, Any]:
+        labels = [f"<={bound:g}" for bound in self.bounds] + [f">{self.bounds[-1]:g}"]
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.total / self.count if self.count else 0.0,
+            "min": self.min if self.count else 0.0,
+            "max": self.max,
+            "histogram": {label: count for label, count in zip(labels, self.counts) if count},
+        }
+
+
+class CallStatistics:
+    """
+    Per-function counters of a Proxy: number of calls and failures, payload sizes and the latency split into the
+    phases serialize (argument conversion and JSON encoding), network (sending, server-side execution and waiting for
+    the response) and deserialize (decoding and result conversion).
+    """
+
+    phases = ("serialize", "network", "deserialize")
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._functions: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, function: str, trace: Dict[str, Any], failed: bool):
+        entry = self._functions.get(function)
+        if entry is None:
+            entry = {
+                "calls": 0,
+                "failures": 0,
+                "request_bytes": 0,
+                "response_bytes": 0,
+                **{phase: LatencyHistogram() for phase in self.phases},
+            }
+            self._functions[function] = entry
+        entry["calls"] += 1
+        entry["failures"] += failed
+        entry["request_bytes"] += trace["request_bytes"]
+        entry["response_bytes"] += trace["response_bytes"]
+        for phase in self.phases:
+            entry[phase].add(trace[phase])
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Return a copy of all counters as plain dictionaries."""
+        return {
+            function: {key: value.snapshot() if isinstance(value, LatencyHistogram) else value
+                       for key, value in entry.items()}
+            for function, entry in self._functions.items()
+        }
+
+
+def check_compression(compression: Optional[Sequence[str]]) -> list:
+    """Return the list of accepted compression codecs and raise a ValueError for unsupported ones."""
+    if compression is None:
+        return []
+    if isinstance(compression, str):
+        compression = [compression]
+    for codec in compression:
+        if codec not in DECOMPRESSORS:
+            raise ValueError(f"Compression codec {codec!r} is not supported. Use one of {list(DECOMPRESSORS)}.")
+    return list(compression)
+
+
+def check_framing(framing: str) -> str:
+    if framing not in FRAMINGS:
+        raise ValueError(f"Framing {framing!r} is not supported. Use one of {list(FRAMINGS)}.")
+    return framing
+
+
+def frame_message(data: bytes, framing: str) -> bytes:
+    """Return a serialized request with the framing of the connection."""
+    if framing == "length":
+        return FRAME_HEADER.pack(len(data), 0) + data
+    return data + b'\n'
+
+
+async def read_message(reader: asyncio.StreamReader, framing: str) -> Tuple[bytes, Optional[memoryview]]:
+    """Read a message with the framing of the connection and return its JSON part and its binary part.
+
+    A frame is read with a single read of the exact size, the binary part is a view of it without copying.
+    """
+    if framing == "length":
+        try:
+            header = await reader.readexactly(FRAME_HEADER.size)
+            json_length, binary_length = FRAME_HEADER.unpack(header)
+            data = await reader.readexactly(json_length + binary_length)
+        except asyncio.IncompleteReadError:
+            raise ConnectionResetError("The server closed the connection.") from None
+        return data[:json_length], memoryview(data)[json_length:] if binary_length else None
+    data = await reader.readline()
+    if not data:
+        raise ConnectionResetError("The server closed the connection.")
+    return data, None
+
+
+async def negotiate_framing(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                            framing: str) -> Optional[str]:
+    """Ask the server of a new connection for a framing and return the framing that is used.
+
+    None is returned for servers that do not know the handshake. They use lines and close the connection after each
+    response, so every request needs a connection of its own. A RemoteException is raised if the server rejects the
+    version of the protocol, and a RuntimeError if the server uses a version that this client does not support.
+    """
+    command = json.dumps({"handshake": {"version": PROTOCOL_VERSION, "framing": framing}})
+    writer.write(command.encode("utf-8") + b'\n')
+    await writer.drain()
+    data, _ = await read_message(reader, "line")
+    response = json.loads(data)
+    if response.get("status") != "success" and "version" not in response:
+        logger.debug("The server does not support the handshake, using one connection per request.")
+        return None
+    ret = ProxyBase.check_result(response)["return"]
+    if ret.get("version") != PROTOCOL_VERSION:
+        msg = f"The server uses protocol version {ret.get('version')!r}, the client uses version {PROTOCOL_VERSION}."
+        raise RuntimeError(msg)
+    return ret["framing"]
+
+
+def connection_closed(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> bool:
+    """Return whether the server has closed an idle connection, e.g. because it was restarted.
+
+    Only valid while no responses are outstanding: the server sends nothing on its own, so a socket that can be read
+    without a request has reached its end.
+    """
+    if reader.at_eof():
+        return True
+    sock = writer.get_extra_info("socket")
+    if sock is None:
+        return False
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+    except (OSError, ValueError):
+        return True
+    return bool(readable)
+
+
+def attach_binary(value, binary: memoryview):
+    """Replace the references of packed arrays to the binary part of a frame by the referenced bytes."""
+    if isinstance(value, list):
+        for element in value:
+            attach_binary(element, binary)
+    elif isinstance(value, dict):
+        if value.get("type") == "array" and isinstance(value.get("value"), dict):
+            reference = value["value"]
+            value["value"] = binary[reference["offset"]:reference["offset"] + reference["length"]]
+        else:
+            for element in value.values():
+                attach_binary(element, binary)
+
+
+class CompressionStatistics:
+    """
+    Counters for the compressed responses received by a client.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.responses = 0
+        self.compressed_bytes = 0
+        self.uncompressed_bytes = 0
+        self.time = 0.0
+
+    def snapshot(self) -> Dict[str, float]:
+        """Return the counters together with the achieved compression ratio (uncompressed / compressed size)."""
+        return {
+            "responses": self.responses,
+            "compressed_bytes": self.compressed_bytes,
+            "uncompressed_bytes": self.uncompressed_bytes,
+            "ratio": self.uncompressed_bytes / self.compressed_bytes if self.compressed_bytes else 1.0,
+            "time": self.time,
+        }
+
+    def decode_response(self, data: bytes, binary: Optional[memoryview] = None) -> Dict[str, Any]:
+        """Decode a response of the server and decompress it if the server did so.
+
+        binary is the binary part of a length-prefixed frame that holds the data of the packed arrays. In a compressed
+        frame, it holds the compressed JSON and binary part, and the JSON part has the "length" of the former.
+        """
+        response = json.loads(data)
+        codec = response.get("compression")
+        if codec is not None:
+            start = time.perf_counter()
+            if "length" in response:
+                compressed = binary if binary is not None else b""
+                uncompressed = DECOMPRESSORS[codec](compressed)
+                length = response["length"]
+                binary = memoryview(uncompressed)[length:] if len(uncompressed) > length else None
+                response = json.loads(uncompressed[:length])
+            else:
+                compressed = base64.b64decode(response["value"])
+                uncompressed = DECOMPRESSORS[codec](compressed)
+                response = json.loads(uncompressed)
+            self.time += time.perf_counter() - start
+            self.responses += 1
+            self.compressed_bytes += len(compressed)
+            self.uncompressed_bytes += len(uncompressed)
+        if binary is not None:
+            for key in ("return", "chunk"):
+                if key in response:
+                    attach_binary(response[key], binary)
+        return response
+
 
 class RemoteException(Exception):
     """
@@ -25,22 +380,383 @@ class RemoteException(Exception):
     """
 
 
+class BatchException(RemoteException):
+    """
+    Raised when a call of a batch failed on the server. The calls after the failed one were not executed.
+    """
+
+    def __init__(self, message: str, index: int, results: list):
+        super().__init__(message)
+        self.index = index
+        """Position of the failed call within the batch."""
+        self.results = results
+        """Results of the calls before the failed one."""
+
+
 class RemoteVar:
-    def __init__(self, variable_reference_name):
+    """
+    Reference to an object that is kept by the server, e.g. a ctypes array returned by an lpt function.
+
+    When the RemoteVar is garbage collected or release() is called, its name is put into the release queue of the
+    connection it came from. The queued names are sent along with the next request, and the server deletes the objects.
+    """
+
+    def __init__(self, variable_reference_name, release_queue: Optional[Deque[str]] = None):
         self._variable_reference_name = variable_reference_name
+        self._release_queue = release_queue
+
+    def __del__(self):
+        self.release()
+
+    def release(self):
+        """Let the server delete the object. The RemoteVar must not be used afterwards."""
+        if self._release_queue is not None:
+            self._release_queue.append(self._variable_reference_name)
+            self._release_queue = None
+
+
+def take_released(release_queue: Deque[str]) -> list:
+    """Remove and return all names from a release queue. Names may be added by other threads at the same time."""
+    return [release_queue.popleft() for _ in range(len(release_queue))]
+
+
+class PendingCall:
+    """
+    A call that has been sent to the server by Proxy.submit, but whose response has not been read yet.
+    """
+
+    def __init__(self, proxy: "Proxy", request_id: int):
+        self._proxy = proxy
+        self._request_id = request_id
+        self._response = None
+        self._result = None
 
+    def done(self) -> bool:
+        """Return True if the response has already been received."""
+        return self._response is not None or self._request_id in self._proxy._responses
+
+    def result(self):
+        """Wait for the response of the call and return its result or raise the server-side exception."""
+        if self._response is None:
+            self._response = self._proxy._receive(self._request_id)
+            if self._response.get("status") == "success":
+                # convert only once, so that each RemoteVar of the result exists a single time
+                self._result = self._proxy._convert_argument_from_json(self._response["return"])
+        self._proxy.check_result(self._response)
+        return self._result
+
+
+class Job:
+    """
+    A command that the server runs in the background, started with start_job of a proxy, Batch or Program.
+
+        job = lpt.start_job("pulse_exec", 0)
+        ...
+        job.result(timeout=10)
+
+    The server keeps the result until it is collected with result. Several jobs, also on different servers, can be
+    started before the results of the first ones are collected.
+    """
+
+    def __init__(self, proxy: "SyncProxyBase", job_id: str, convert: Callable[[Dict[str, Any]], Any]):
+        self._proxy = proxy
+        self.job_id = job_id
+        # converts the response of the job to its result
+        self._convert = convert
+        # "collected" or "cancelled" once the job is no longer kept by the server
+        self._final_status: Optional[str] = None
+        self._result = None
+
+    def _request(self, action: str, **fields) -> Dict[str, Any]:
+        return self._proxy._request(dict(fields, job_id=self.job_id, action=action))
+
+    def status(self) -> str:
+        """Return the status of the job at the server: "queued", "running", "done" or "failed".
+
+        Once the result was collected or the job was cancelled, "collected" or "cancelled" is returned locally.
+        """
+        if self._final_status is not None:
+            return self._final_status
+        return self._proxy._convert_argument_from_json(self._proxy.check_result(self._request("status"))["return"])
+
+    def done(self) -> bool:
+        """Return True if the job has finished or was cancelled."""
+        return self.status() not in ("queued", "running")
+
+    def cancel(self, abort: Optional[str] = None) -> bool:
+        """Cancel the job if it has not been started yet, and return whether it was cancelled.
+
+        A running job is ended by calling the function abort of the target, e.g. "dev_abort", and is then cancelled
+        as well.
+        """
+        if self._final_status is not None:
+            return False
+        fields = {} if abort is None else {"abort": abort, "class": self._proxy._target_class}
+        response = self._proxy.check_result(self._request("cancel", **fields))
+        cancelled = self._proxy._convert_argument_from_json(response["return"])
+        if cancelled:
+            self._final_status = "cancelled"
+        return cancelled
+
+    def result(self, timeout: Optional[float] = None):
+        """Wait until the job has finished, at most timeout seconds, and return its result or raise its exception.
+
+        If the job has not finished within the timeout, a TimeoutError is raised and the job continues.
+        """
+        if self._final_status is None:
+            fields = {} if timeout is None else {"timeout": timeout}
+            response = self._request("result", **fields)
+            if "job_status" in response:
+                raise TimeoutError(f"The job {self.job_id} is still {response['job_status']}.")
+            # convert only once, so that each RemoteVar of the result exists a single time
+            self._final_status = "collected"
+            try:
+                self._result = self._convert(response)
+            except BaseException as e:
+                self._result = e
+        if isinstance(self._result, BaseException):
+            raise self._result
+        return self._result
+
+
+class Batch:
+    """
+    Records function calls of a Proxy and sends them to the server as one message when the with-block is left.
+
+        with lpt.batch() as b:
+            b.pulse_load(card_id, channel, 1e6)
+            b.pulse_output(card_id, channel, 1)
+        print(b.results)
+
+    The server executes the calls in the order they were recorded and stops at the first exception, which is raised
+    as BatchException.
+    """
+
+    _name = "batch"
+
+    def __init__(self, proxy: "SyncProxyBase"):
+        self._proxy = proxy
+        self._calls = []
+        # The arguments of the recorded calls are referenced until the calls are sent. Otherwise, a RemoteVar that is
+        # only used as argument could be released with the same message, and the server would delete its object
+        # before executing the calls.
+        self._arguments = []
+        self.results = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # calls are only sent if the with-block finished without exception
+        if exc_type is None:
+            self.execute()
+
+    def __getattr__(self, function):
+        if function[0] == "_":
+            raise AttributeError(function)
+
+        def record_call(*args, **kwargs):
+            self._calls.append(self._proxy._make_call_command(function, args, kwargs))
+            self._arguments.append((args, kwargs))
+            return self._recorded(len(self._calls) - 1)
+
+        return record_call
+
+    def _recorded(self, index: int):
+        return index
+
+    def _make_command(self, calls: list) -> Dict[str, Any]:
+        return {
+            "class": self._proxy._target_class,
+            "batch": calls
+        }
 
-class Proxy:
+    def execute(self) -> list:
+        """Send the recorded calls to the server and return their results."""
+        calls, self._calls = self._calls, []
+        if not calls:
+            self.results = []
+            return self.results
+        for call in calls:
+            del call["class"]
+        try:
+            response = self._proxy._request(self._make_command(calls))
+        finally:
+            self._arguments = []
+        return self._convert_response(response, calls)
+
+    def start_job(self) -> Job:
+        """Send the recorded calls to the server as a job that runs in the background, instead of executing them.
+
+        The results are stored in results once they are collected with Job.result.
+        """
+        calls, self._calls = self._calls, []
+        if not calls:
+            raise ValueError(f"The {self._name} does not contain any calls.")
+        for call in calls:
+            del call["class"]
+        command_json = self._make_command(calls)
+        command_json["job"] = True
+        try:
+            response = self._proxy.check_result(self._proxy._request(command_json))
+        finally:
+            self._arguments = []
+        job_id = self._proxy._convert_argument_from_json(response["return"])
+        return Job(self._proxy, job_id, lambda job_response: self._convert_response(job_response, calls))
+
+    def _convert_response(self, response: Dict[str, Any], calls: list) -> list:
+        try:
+            result_json = self._proxy.check_result(response)
+        except RemoteException as e:
+            if "index" not in response:
+                raise
+            index = response["index"]
+            results = self._proxy._convert_argument_from_json(response["return"])
+            message = f"Call {index} ({calls[index]['function']}) of the {self._name} failed. {e}"
+            raise BatchException(message, index, results).with_traceback(e.__traceback__) from None
+        self.results = self._proxy._convert_argument_from_json(result_json["return"])
+        return self.results
+
+
+class ResultReference:
+    """
+    Placeholder for the result of a call recorded in a Program. It can be used as argument of the following calls of
+    the same program, also with an element selected (reference[0]) or a number added (reference - 1).
+    """
+
+    def __init__(self, index: int, item: tuple = (), offset=0):
+        self.index = index
+        self.item = item
+        self.offset = offset
+
+    def __getitem__(self, item: int) -> "ResultReference":
+        if self.offset:
+            raise TypeError("An element cannot be selected after a number was added to the result.")
+        return ResultReference(self.index, self.item + (item,))
+
+    def __add__(self, other) -> "ResultReference":
+        if not isinstance(other, (int, float)) or isinstance(other, bool):
+            return NotImplemented
+        return ResultReference(self.index, self.item, self.offset + other)
+
+    __radd__ = __add__
+
+    def __sub__(self, other) -> "ResultReference":
+        if not isinstance(other, (int, float)) or isinstance(other, bool):
+            return NotImplemented
+        return self + (-other)
+
+    def to_json(self) -> Dict[str, Any]:
+        reference = {
+            "type": "Result",
+            "value": self.index
+        }
+        if self.item:
+            reference["item"] = list(self.item)
+        if self.offset:
+            reference["offset"] = self.offset
+        return reference
+
+
+class Program(Batch):
+    """
+    A Batch whose calls can use the results of earlier calls as arguments. The server runs the whole program next to
+    the instrument and returns only the results selected with returns, so a complete cycle needs one round trip:
+
+        with lpt.program() as program:
+            card_id = program.getinstid("PMU1")
+            count = program.pulse_chan_status(card_id, 1)
+            data = program.pulse_fetch(card_id, 1, 0, count - 1)
+            program.returns(data)
+        v, i, t, status = program.results[0]
+
+    Recording a call returns a ResultReference instead of the index of the call.
+    """
+
+    _name = "program"
+
+    def __init__(self, proxy: "SyncProxyBase"):
+        super().__init__(proxy)
+        self._outputs = None
+
+    def returns(self, *references: ResultReference):
+        """Select the calls whose results are returned, in this order. By default, all results are returned."""
+        if any(reference.item or reference.offset for reference in references):
+            raise ValueError("Only the complete results of calls can be returned.")
+        self._outputs = [reference.index for reference in references]
+
+    def _recorded(self, index: int) -> ResultReference:
+        return ResultReference(index)
+
+    def _make_command(self, calls: list) -> Dict[str, Any]:
+        command_json = super()._make_command(calls)
+        if self._outputs is not None:
+            command_json["outputs"], self._outputs = self._outputs, None
+        return command_json
+
+
+class RemoteDefault:
+    """
+    Placeholder for the default value of a parameter of a served function. Defaults are applied by the server, the
+    client only shows them in the signature of the stub.
+    """
+
+    def __init__(self, text: str):
+        self._text = text
+
+    def __repr__(self):
+        return self._text
+
+
+def build_signature(spec: Dict[str, Any]) -> Optional[inspect.Signature]:
+    """Create the signature of a served function from its description in the server schema."""
+    if spec["parameters"] is None:
+        return None
+    parameters = []
+    for parameter in spec["parameters"]:
+        default = parameter.get("default")
+        parameters.append(inspect.Parameter(
+            parameter["name"],
+            getattr(inspect.Parameter, parameter["kind"]),
+            default=inspect.Parameter.empty if default is None else RemoteDefault(default),
+            annotation=parameter["annotation"] or inspect.Parameter.empty,
+        ))
+    return_annotation = spec["return_annotation"] or inspect.Signature.empty
+    return inspect.Signature(parameters, return_annotation=return_annotation)
+
+
+def describe_stub(stub: Callable, function: str, spec: Dict[str, Any], signature: Optional[inspect.Signature]):
+    """Give a stub the name, docstring and signature of the served function, e.g. for help() and autocompletion."""
+    stub.__name__ = function
+    stub.__qualname__ = function
+    stub.__doc__ = spec["doc"]
+    if signature is not None:
+        stub.__signature__ = signature
+
+
+def check_arguments(function: str, signature: Optional[inspect.Signature], args, kwargs):
+    """Raise a TypeError if the arguments do not match the signature of the served function."""
+    if signature is None:
+        return
+    try:
+        signature.bind(*args, **kwargs)
+    except TypeError as e:
+        raise TypeError(f"{function}(): {e}") from None
+
+
+class ProxyBase:
+    """
+    Conversion of arguments and results between Python and the JSON protocol of the tcp_server, shared by the
+    synchronous and the asynchronous proxies.
+    """
     _target_class: str
+    # names of released RemoteVars that still have to be sent to the server
+    _release_queue: Deque[str]
 
-    def __init__(self, address: str, port: int, target_class: str):
-        self.loop = asyncio.new_event_loop()
-        self._target_class = target_class
-        self.address = address
-        self.port = port
-        
-    def __del__(self):
-        self.loop.close()
+    # Long lists of numbers are transferred by the server as packed binary arrays. They are returned as lists by
+    # default, like all other lists. Set to "array" to get array.array or to "numpy" to get numpy arrays instead, lists
+    # with fewer than 16 elements (Server.packed_array_min_length) or mixed types are still returned as lists then.
+    array_format = "list"
 
     def _convert_argument_from_json(self, arg):
         if isinstance(arg, list):
@@ -48,15 +764,45 @@ class Proxy:
         arg_type = arg["type"]
         arg_value = arg["value"]
         if arg_type == "RemoteVar":
-            return RemoteVar(arg_value)
+            return RemoteVar(arg_value, self._release_queue)
         elif arg_type == "NoneType":
             return None
+        elif arg_type == "array":
+            return self._unpack_array(arg)
         return getattr(builtins, arg_type)(arg_value)
 
+    def _unpack_array(self, arg):
+        data = arg["value"]
+        if isinstance(data, str):
+            data = base64.b64decode(data)
+        if self.array_format == "numpy":
+            if not numpy_imported:
+                raise ModuleNotFoundError("numpy is needed to return arrays in numpy format.")
+            byteorder = "<" if arg["byteorder"] == "little" else ">"
+            return numpy.frombuffer(data, dtype=byteorder + arg["typecode"])
+        values = array.array(arg["typecode"])
+        values.frombytes(data)
+        if arg["byteorder"] != sys.byteorder:
+            values.byteswap()
+        if self.array_format == "list":
+            return values.tolist()
+        return values
+
     def _convert_argument_to_json(self, arg):
         # tuples become lists in json anyway, so treat them the same here
         if isinstance(arg, list) or isinstance(arg, tuple):
             return [self._convert_argument_to_json(element) for element in arg]
+        if isinstance(arg, array.array) and arg.typecode in ("d", "q"):
+            return {
+                "type": "array",
+                "typecode": arg.typecode,
+                "byteorder": sys.byteorder,
+                "value": base64.b64encode(arg.tobytes()).decode("ascii")
+            }
+        if numpy_imported and isinstance(arg, numpy.ndarray):
+            return self._convert_argument_to_json(arg.tolist())
+        if isinstance(arg, ResultReference):
+            return arg.to_json()
         arg_type = type(arg).__name__
         # complex types are not transferred but saved locally and only a reference is sent back
         if arg_type == "RemoteVar":
@@ -66,24 +812,57 @@ class Proxy:
             "value": arg
         }
 
-    async def _async_send_to_server(self, command: str) -> str:
-        reader, writer = await asyncio.open_connection(
-            self.address, self.port)
+    def _make_call_command(self, function: str, args, kwargs) -> Dict[str, Any]:
+        return {
+            "class": self._target_class,
+            "function": function,
+            "args": [self._convert_argument_to_json(arg) for arg in args],
+            "kwargs": {k: self._convert_argument_to_json(v) for k, v in kwargs.items()},
+            "packed": True
+        }
+
+    def _make_repeat_command(self, function: str, count: int, interval: Optional[float], args,
+                             kwargs) -> Dict[str, Any]:
+        command_json = self._make_call_command(function, args, kwargs)
+        command_json["repeat"] = count
+        if interval is not None:
+            command_json["interval"] = interval
+        return command_json
+
+    def _make_poll_command(self, value, function: str, item: Optional[int], timeout: Optional[float],
+                           abort: Optional[str], args, kwargs) -> Dict[str, Any]:
+        command_json = self._make_call_command(function, args, kwargs)
+        poll = {"while": self._convert_argument_to_json(value)}
+        for key, option in (("item", item), ("timeout", timeout), ("abort", abort)):
+            if option is not None:
+                poll[key] = option
+        command_json["poll"] = poll
+        return command_json
 
-        writer.write(command.encode("utf-8") + b'\n')
-        await writer.drain()
+    def _make_stream_command(self, function: str, chunk_size: Optional[int], args, kwargs) -> Dict[str, Any]:
+        command_json = self._make_call_command(function, args, kwargs)
+        command_json["stream"] = True
+        if chunk_size is not None:
+            command_json["chunk_size"] = chunk_size
+        return command_json
 
-        data = await reader.readline()
+    def _convert_stream_message(self, response: Dict[str, Any]) -> list:
+        """Return the chunks contained in a message of a stream: one for a chunk and none for the final response.
 
-        writer.close()
-        return data.decode("utf-8")
+        Servers without support for streams answer with a single response that contains the whole result.
+        """
+        response = self.check_result(response)
+        if "chunk" in response:
+            return [self._convert_argument_from_json(response["chunk"])]
+        if "stream" in response:
+            return []
+        return [self._convert_argument_from_json(response["return"])]
 
-    def _send_to_server(self, command: str) -> str:
-        result = self.loop.run_until_complete(self._async_send_to_server(command))
-        return result
+    def unpack_result(self, response: str):
+        return self.check_result(json.loads(response))
 
-    def unpack_result(self, response):
-        result = json.loads(response)
+    @staticmethod
+    def check_result(result: Dict[str, Any]):
         status = result.get("status", "invalid")
         if status == "success":
             return result
@@ -104,22 +883,135 @@ class Proxy:
                 
         raise Exception("Error decoding the response from the server")
 
+
+class SyncProxyBase(ProxyBase, abc.ABC):
+    """
+    Blocking access to the functions and attributes of a served object. Subclasses implement the transport in _request.
+    """
+
+    @abc.abstractmethod
+    def _request(self, command_json: Dict[str, Any]) -> Dict[str, Any]:
+        """Send one command to the server and return its response."""
+
+    def load_snapshot(self):
+        """Fetch all constants of the target from the server and store them as local attributes."""
+        result_json = self.check_result(self._request({
+            "class": self._target_class,
+            "namespace": True
+        }))
+        for name, value in result_json["return"].items():
+            self.__dict__[name] = self._convert_argument_from_json(value)
+
+    def load_stubs(self, schema: Optional[Dict[str, Any]] = None):
+        """Create local stubs for all functions of the target and store all its constants as local attributes.
+
+        The schema is fetched from the server with one request if it is not given. The stubs check the arguments
+        against the signatures of the served functions before sending a call.
+        """
+        if schema is None:
+            result_json = self.check_result(self._request({
+                "class": self._target_class,
+                "schema": True
+            }))
+            schema = result_json["return"][self._target_class]
+        for name, value in schema["constants"].items():
+            self.__dict__[name] = self._convert_argument_from_json(value)
+        for name, spec in schema["functions"].items():
+            self.__dict__[name] = self._make_stub(name, spec)
+
+    def _make_stub(self, function: str, spec: Dict[str, Any]) -> Callable:
+        signature = build_signature(spec)
+
+        def stub(*args, **kwargs):
+            check_arguments(function, signature, args, kwargs)
+            return self._call(function, args, kwargs)
+
+        describe_stub(stub, function, spec, signature)
+        return stub
+
+    def _call(self, function: str, args, kwargs):
+        command_json = self._make_call_command(function, args, kwargs)
+        result_json = self.check_result(self._request(command_json))
+        return self._convert_argument_from_json(result_json["return"])
+
+    def start_job(self, function: str, *args, **kwargs) -> Job:
+        """Let the server call a function of the target in the background and return the Job right away.
+
+        The server executes the job in order with the other calls of this client, and keeps its result until it is
+        collected with Job.result. Use start_job of a Program for a whole configure-execute-fetch sequence.
+        """
+        command_json = self._make_call_command(function, args, kwargs)
+        command_json["job"] = True
+        job_id = self._convert_argument_from_json(self.check_result(self._request(command_json))["return"])
+
+        def convert(response: Dict[str, Any]):
+            return self._convert_argument_from_json(self.check_result(response)["return"])
+
+        return Job(self, job_id, convert)
+
+    def repeat(self, function: str, count: int, *args, interval: Optional[float] = None, **kwargs):
+        """Call a function of the target count times with the same arguments in a single request.
+
+        Return the results and the host times of the server (seconds since the epoch) at which the calls were
+        started, e.g. currents, times = lpt.repeat("intgi", 1000, card_id). With interval (in seconds), the calls are
+        started at this fixed rate.
+        """
+        command_json = self._make_repeat_command(function, count, interval, args, kwargs)
+        result_json = self.check_result(self._request(command_json))
+        values, timestamps = self._convert_argument_from_json(result_json["return"])
+        return values, timestamps
+
+    def wait_while(self, value, function: str, *args, item: Optional[int] = None, timeout: Optional[float] = None,
+                   abort: Optional[str] = None, **kwargs):
+        """Let the server call a function of the target until its result (or its element item) differs from value,
+        and return the last result. Waiting for the end of a pulse test needs a single request:
+
+            status, elapsed_time = lpt.wait_while(param.PMU_TEST_STATUS_RUNNING, "pulse_exec_status", item=0,
+                                                  timeout=10, abort="dev_abort")
+
+        The server polls with intervals that grow with the waiting time, and executes the calls of other clients in
+        between. After timeout seconds, the function abort of the target is called and a TimeoutError is raised as
+        RemoteException.
+        """
+        command_json = self._make_poll_command(value, function, item, timeout, abort, args, kwargs)
+        return self._convert_argument_from_json(self.check_result(self._request(command_json))["return"])
+
+    def flush_releases(self):
+        """Send the names of released RemoteVars to the server right away instead of with the next request."""
+        if self._release_queue:
+            self.check_result(self._request({}))
+
+    def server_metrics(self) -> Dict[str, Any]:
+        """Return the metrics of the server, e.g. the call counts and execution times of the served functions."""
+        return self.check_result(self._request({"metrics": True}))["return"]
+
+    def batch(self) -> Batch:
+        """Return a context manager that records calls and sends them to the server in a single message."""
+        return Batch(self)
+
+    def program(self) -> Program:
+        """Return a context manager that records calls and sends them to the server in a single message.
+
+        Unlike in a batch, the arguments of the calls can refer to the results of earlier calls, see Program.
+        """
+        return Program(self)
+
+    @contextmanager
+    def instrument_lock(self):
+        """Return a context manager that reserves the instrument for the session of this client.
+
+        Within the with block, the calls of other clients are held back by the server, so a sequence of calls is not
+        interleaved with theirs. The server also releases the lock when all connections of the session are closed.
+        """
+        self.check_result(self._request({"lock": True}))
+        try:
+            yield self
+        finally:
+            self.check_result(self._request({"lock": False}))
+
     def __getattr__(self, function):
         def handle_call(*args, **kwargs):
-            args = args or []
-            kwargs = kwargs or {}
-            command_json = {
-                "class": self._target_class,
-                "function": function,
-                "args": [self._convert_argument_to_json(arg) for arg in args],
-                "kwargs": {k: self._convert_argument_to_json(v) for k, v in kwargs.items()}
-            }
-            command = json.dumps(command_json)
-            logger.debug(f"Request: {command}")
-            result = self._send_to_server(command)
-            logger.debug(f"Response: {result}")
-            result_json = self.unpack_result(result)
-            return self._convert_argument_from_json(result_json["return"])
+            return self._call(function, args, kwargs)
 
         if function[0] != "_":
             # try to determine if it is an attribute and not a function
@@ -127,12 +1019,327 @@ class Proxy:
                 "class": self._target_class,
                 "attribute": function
             }
-            command = json.dumps(command_json)
-            result = self._send_to_server(command)
-            result_json = self.unpack_result(result)
+            result_json = self.check_result(self._request(command_json))
             if result_json["return"]["type"] == "callable":
+                # Remember the function as instance attribute. Further lookups of this name are then resolved
+                # locally and do not reach __getattr__ anymore, so each call needs a single round trip only.
+                self.__dict__[function] = handle_call
                 return handle_call
-            logger.debug(f"Request: {command}")
-            logger.debug(f"Response: {result}")
             return self._convert_argument_from_json(result_json["return"])
         return None
+
+
+class Proxy(SyncProxyBase):
+    """
+    Client-side stand-in for an object served by the tcp_server.
+
+    With keep_alive enabled (default), the TCP connection is opened on the first call and reused for all following
+    calls. If the connection was closed in the meantime, e.g. by a server restart, it is re-established transparently.
+    With keep_alive disabled, a new connection is opened for every call. instrument_lock needs keep_alive, as the server
+    releases the lock of a session with its last connection. Whether the server keeps connections open is checked with
+    a handshake on the first connection, servers without support for it get a new connection for every call as well.
+
+    Calls can be pipelined with submit: the requests are sent immediately, and the responses are collected later via
+    the returned PendingCall objects. Each request carries an id that the server copies to its response.
+
+    With snapshot enabled, all constants of the target (e.g. the whole param module) are fetched with a single request
+    when the Proxy is created. Accessing them afterwards is a plain local attribute lookup.
+
+    compression is a codec name or a list of codec names ("zlib", "lzma") in order of preference. The server compresses
+    large responses with the first of them it supports. The achieved ratio and the time spent for decompression are
+    counted in compression_statistics.
+
+    With stubs enabled, the signatures of all functions and the constants of the target are fetched with one request
+    when the Proxy is created, see load_stubs.
+
+    With statistics enabled, the number, payload sizes and latencies of the calls of each function are recorded in
+    call_statistics. It can also be enabled or disabled later with enable_statistics.
+
+    With framing "length", each new connection is switched to length-prefixed frames by a handshake. The data of
+    packed arrays is then transferred as binary instead of base64. Servers without support for it keep using lines.
+
+    Large results can be received in chunks with stream, without holding the whole result in memory.
+    """
+
+    def __init__(self, address: str, port: int, target_class: str, keep_alive: bool = True, snapshot: bool = False,
+                 compression: Optional[Sequence[str]] = None, stubs: bool = False, statistics: bool = False,
+                 framing: str = "line"):
+        self.loop = asyncio.new_event_loop()
+        self._target_class = target_class
+        self.address = address
+        self.port = port
+        self.keep_alive = keep_alive
+        self.compression = check_compression(compression)
+        self.compression_statistics = CompressionStatistics()
+        self.framing = check_framing(framing)
+        # the framing that was negotiated for the current connection
+        self._framing = "line"
+        # whether the server keeps connections open for further requests, None until the first handshake
+        self._keeps_connections: Optional[bool] = None
+        self.session = SESSION
+        self.call_statistics: Optional[CallStatistics] = CallStatistics() if statistics else None
+        # timings of the call that is currently being traced for the call statistics
+        self._trace: Optional[Dict[str, Any]] = None
+        self._release_queue = deque()
+        self._reader = None
+        self._writer = None
+        self._request_count = 0
+        # ids of the requests that have been sent on the current connection, but whose responses were not read yet
+        self._pending: Deque[int] = deque()
+        # responses that have been read while waiting for the response of another request
+        self._responses: Dict[int, Dict[str, Any]] = {}
+        # chunks of streams that have been read, but not consumed yet
+        self._chunks: Dict[int, Deque[Dict[str, Any]]] = {}
+        # request id of the stream that is being iterated
+        self._stream: Optional[int] = None
+        if snapshot:
+            self.load_snapshot()
+        if stubs:
+            self.load_stubs()
+
+    def __del__(self):
+        # __del__ can be called while another event loop is running, so the transport is closed without waiting
+        if self._writer is not None:
+            self._writer.close()
+        self.loop.close()
+
+    # maximum number of requests that are sent before the oldest response has to be read
+    max_pending = 64
+
+    def close(self):
+        """Close the connection to the server. It will be reopened automatically with the next call.
+
+        Responses of submitted calls that have not been read yet are lost.
+        """
+        if self._writer is not None and not self.loop.is_closed():
+            self.loop.run_until_complete(self._async_disconnect())
+
+    async def _async_connect(self):
+        await self._async_open()
+        if self._keeps_connections is False or (self._keeps_connections and self.framing == "line"):
+            # known from the handshake of a previous connection
+            return
+        framing = await negotiate_framing(self._reader, self._writer, self.framing)
+        self._keeps_connections = framing is not None
+        self._framing = framing or "line"
+        if framing is None:
+            # servers without support for the handshake close the connection after answering it
+            await self._async_disconnect()
+            await self._async_open()
+
+    def _reuses_connection(self) -> bool:
+        return self.keep_alive and bool(self._keeps_connections)
+
+    async def _async_open(self):
+        self._reader, self._writer = await asyncio.open_connection(self.address, self.port, limit=MESSAGE_LIMIT)
+        sock = self._writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    async def _async_disconnect(self):
+        if self._writer is not None:
+            self._writer.close()
+            # StreamWriter.wait_closed was added in Python 3.7
+            if hasattr(self._writer, "wait_closed"):
+                try:
+                    await self._writer.wait_closed()
+                except (ConnectionError, OSError):
+                    pass
+        self._reader = None
+        self._writer = None
+        # responses that have already been received stay available, all others are lost
+        self._pending.clear()
+
+    async def _async_write(self, command_json: Dict[str, Any]) -> int:
+        self._request_count += 1
+        request_id = self._request_count
+        command_json["id"] = request_id
+        command_json["session"] = self.session
+        if self.compression:
+            command_json["compression"] = self.compression
+        if self._release_queue:
+            command_json["release"] = take_released(self._release_queue)
+        apply_deadline(command_json)
+        trace = self._trace
+        if trace is not None:
+            start = time.perf_counter()
+        data = frame_message(json.dumps(command_json).encode("utf-8"), self._framing)
+        if trace is not None:
+            trace["serialize"] += time.perf_counter() - start
+            trace["request_bytes"] += len(data)
+        logger.debug("Request: %s", data)
+        self._writer.write(data)
+        self._pending.append(request_id)
+        await self._writer.drain()
+        return request_id
+
+    async def _async_read(self, request_id: int, stream: bool = False) -> Dict[str, Any]:
+        # with stream, the next chunk of the stream is returned, or its final response after the last chunk
+        while request_id not in self._responses and not (stream and self._chunks.get(request_id)):
+            if request_id not in self._pending:
+                raise ConnectionResetError("The connection was closed before the response was received.")
+            data, binary = await read_message(self._reader, self._framing)
+            logger.debug("Response: %s", data)
+            trace = self._trace
+            if trace is not None:
+                start = time.perf_counter()
+            response = self.compression_statistics.decode_response(data, binary)
+            if trace is not None:
+                trace["deserialize"] += time.perf_counter() - start
+                trace["response_bytes"] += len(data) + (len(binary) if binary is not None else 0)
+            # servers that do not support request ids answer in order
+            response_id = response.get("id", self._pending[0])
+            if "chunk" in response:
+                # the request stays pending until the final response of the stream
+                self._chunks.setdefault(response_id, deque()).append(response)
+                continue
+            self._pending.remove(response_id)
+            self._responses[response_id] = response
+        if stream and self._chunks.get(request_id):
+            return self._chunks[request_id].popleft()
+        return self._responses.pop(request_id)
+
+    def _check_no_stream(self):
+        # the server answers in order, so the response of another request would only arrive after all chunks
+        if self._stream is not None and self._stream in self._pending:
+            raise RuntimeError("A stream is being received on the connection of this Proxy. Iterate it to the end "
+                               "before other calls, or make them with another Proxy.")
+
+    async def _async_ensure_connection(self):
+        if self._writer is not None and not self._pending and connection_closed(self._reader, self._writer):
+            # the reused connection went stale, e.g. because the server was restarted
+            logger.debug("Connection closed by the server, reconnecting.")
+            await self._async_disconnect()
+        if self._writer is None:
+            await self._async_connect()
+
+    async def _async_request(self, command_json: Dict[str, Any]) -> Dict[str, Any]:
+        self._check_no_stream()
+        # A request is never repeated: once it has been written, the server may have executed it even if the
+        # connection fails before the response is read.
+        await self._async_ensure_connection()
+        try:
+            request_id = await self._async_write(command_json)
+            response = await self._async_read(request_id)
+        except BaseException:
+            # never reuse a connection that might still deliver the response of an aborted request
+            await self._async_disconnect()
+            raise
+        if not self._reuses_connection() and not self._pending:
+            await self._async_disconnect()
+        return response
+
+    async def _async_submit(self, command_json: Dict[str, Any]) -> int:
+        self._check_no_stream()
+        try:
+            if self._pending and (len(self._pending) >= self.max_pending or self._keeps_connections is False):
+                # read the oldest response, so that neither side blocks on full socket buffers, servers without
+                # support for the handshake only answer one request per connection
+                oldest = self._pending[0]
+                self._responses[oldest] = await self._async_read(oldest)
+                if not self._reuses_connection() and not self._pending:
+                    await self._async_disconnect()
+            await self._async_ensure_connection()
+            return await self._async_write(command_json)
+        except BaseException:
+            await self._async_disconnect()
+            raise
+
+    async def _async_receive(self, request_id: int, stream: bool = False) -> Dict[str, Any]:
+        try:
+            response = await self._async_read(request_id, stream)
+        except BaseException:
+            await self._async_disconnect()
+            raise
+        if "chunk" not in response and not self._reuses_connection() and not self._pending:
+            await self._async_disconnect()
+        return response
+
+    def _request(self, command_json: Dict[str, Any]) -> Dict[str, Any]:
+        return self.loop.run_until_complete(self._async_request(command_json))
+
+    def enable_statistics(self, enabled: bool = True):
+        """Start recording call statistics, or stop it and discard the recorded values."""
+        if not enabled:
+            self.call_statistics = None
+        elif self.call_statistics is None:
+            self.call_statistics = CallStatistics()
+
+    def _call(self, function: str, args, kwargs):
+        if self.call_statistics is None:
+            return super()._call(function, args, kwargs)
+
+        trace = {"serialize": 0.0, "network": 0.0, "deserialize": 0.0, "request_bytes": 0, "response_bytes": 0}
+        failed = True
+        try:
+            start = time.perf_counter()
+            command_json = self._make_call_command(function, args, kwargs)
+            trace["serialize"] += time.perf_counter() - start
+
+            # the JSON encoding and decoding within the request are added to the trace by _async_write and _async_read
+            coding_before = trace["serialize"] + trace["deserialize"]
+            self._trace = trace
+            start = time.perf_counter()
+            try:
+                response = self._request(command_json)
+            finally:
+                self._trace = None
+                coding = trace["serialize"] + trace["deserialize"] - coding_before
+                trace["network"] = time.perf_counter() - start - coding
+
+            start = time.perf_counter()
+            try:
+                result = self._convert_argument_from_json(self.check_result(response)["return"])
+            finally:
+                trace["deserialize"] += time.perf_counter() - start
+            failed = False
+            return result
+        finally:
+            self.call_statistics.record(function, trace, failed)
+
+    def _receive(self, request_id: int, stream: bool = False) -> Dict[str, Any]:
+        return self.loop.run_until_complete(self._async_receive(request_id, stream))
+
+    def submit(self, function: str, *args, **kwargs) -> PendingCall:
+        """Send a function call to the server without waiting for its response.
+
+        The server executes the calls of one connection in the order they were submitted. Use PendingCall.result() to
+        collect the return value.
+        """
+        command_json = self._make_call_command(function, args, kwargs)
+        request_id = self.loop.run_until_complete(self._async_submit(command_json))
+        return PendingCall(self, request_id)
+
+    def stream(self, function: str, *args, chunk_size: Optional[int] = None, **kwargs) -> Iterator:
+        """Call a function of the target and return an iterator over the chunks of its result.
+
+        The server sends the chunks one after the other and only produces the next one when the previous one has been
+        sent, so with a loop like
+
+            for voltages, currents, times, statuses in lpt.stream("pulse_fetch_chunks", card_id, 1, 0, 999999):
+                ...
+
+        neither side holds the whole result in memory. Generator functions are streamed item by item, list results
+        are sliced into chunks of chunk_size elements (lists of lists in parallel). The request is sent right away.
+        If the iteration is stopped early, the connection is closed to stop the stream, which also discards the
+        responses of submitted calls. Other calls of this Proxy raise a RuntimeError until the iteration has ended,
+        as their responses would only arrive after the remaining chunks. Use another Proxy for calls in between.
+        """
+        command_json = self._make_stream_command(function, chunk_size, args, kwargs)
+        request_id = self.loop.run_until_complete(self._async_submit(command_json))
+        self._stream = request_id
+        return self._iterate_stream(request_id)
+
+    def _iterate_stream(self, request_id: int) -> Iterator:
+        finished = False
+        try:
+            while not finished:
+                response = self._receive(request_id, stream=True)
+                finished = "chunk" not in response
+                yield from self._convert_stream_message(response)
+        finally:
+            self._chunks.pop(request_id, None)
+            if self._stream == request_id:
+                self._stream = None
+            if not finished and request_id in self._pending and not self.loop.is_closed():
+                self.loop.run_until_complete(self._async_disconnect())
@@ -0,0 +1,113 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Deque, Dict, Optional, Sequence
+
+from .AsyncProxyClass import AsyncConnection
+from .ProxyClass import ProxyBase, SyncProxyBase
+
+
+class SessionProxy(SyncProxyBase):
+    """
+    Client-side stand-in for an object served by the tcp_server that sends its requests via a Session.
+    """
+
+    def __init__(self, session: "Session", target_class: str, snapshot: bool = False):
+        self._session = session
+        self._target_class = target_class
+        if snapshot:
+            self.load_snapshot()
+
+    @property
+    def _release_queue(self) -> Deque[str]:
+        return self._session._connection.release_queue
+
+    def _request(self, command_json: Dict[str, Any]) -> Dict[str, Any]:
+        return self._session.request(command_json)
+
+    async def _async_call(self, function: str, args, kwargs):
+        command_json = self._make_call_command(function, args, kwargs)
+        result_json = self.check_result(await self._session._connection.request(command_json))
+        return self._convert_argument_from_json(result_json["return"])
+
+    def submit(self, function: str, *args, **kwargs) -> Future:
+        """Send a function call to the server without waiting for its response.
+
+        The returned future provides the return value via result().
+        """
+        return asyncio.run_coroutine_threadsafe(self._async_call(function, args, kwargs), self._session.loop)
+
+
+class Session:
+    """
+    A connection to the tcp_server that is shared by the proxies of several served objects and by several threads.
+
+        with Session("192.168.0.4", 8888) as session:
+            lpt = session.lpt
+            param = session.target("param", snapshot=True)
+            card_id = lpt.getinstid("SMU1")
+
+    The session owns one TCP connection and one I/O thread running an event loop. Calls can be issued from any thread;
+    the requests carry ids, so the responses are routed to the calling threads even if several calls are in flight.
+    The compression codecs accepted for responses and the framing are passed on to the AsyncConnection.
+
+    With stubs enabled, the schema of all served objects is fetched with a single request when the session is created,
+    and all proxies get local stubs for the functions and the constants of their target.
+    """
+
+    def __init__(self, address: str, port: int, compression: Optional[Sequence[str]] = None, stubs: bool = False,
+                 framing: str = "line"):
+        self.address = address
+        self.port = port
+        self._connection = AsyncConnection(address, port, compression, framing)
+        self.compression_statistics = self._connection.compression_statistics
+        self._proxies: Dict[str, SessionProxy] = {}
+        self._lock = threading.Lock()
+        self._schema: Optional[Dict[str, Any]] = None
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop, name="TCPClientSession", daemon=True)
+        self._thread.start()
+        if stubs:
+            response = self.request({"schema": True})
+            self._schema = ProxyBase.check_result(response)["return"]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def request(self, command_json: Dict[str, Any]) -> Dict[str, Any]:
+        """Send a command to the server and wait for the decoded response."""
+        return asyncio.run_coroutine_threadsafe(self._connection.request(command_json), self.loop).result()
+
+    def target(self, target_class: str, snapshot: bool = False) -> SessionProxy:
+        """Return the proxy of a served object. With snapshot enabled, the constants of the target are fetched."""
+        with self._lock:
+            proxy = self._proxies.get(target_class)
+            if proxy is None:
+                proxy = SessionProxy(self, target_class)
+                if self._schema is not None:
+                    proxy.load_stubs(self._schema[target_class])
+                self._proxies[target_class] = proxy
+        if snapshot:
+            proxy.load_snapshot()
+        return proxy
+
+    def close(self):
+        """Close the connection and stop the I/O thread."""
+        if self.loop.is_closed():
+            return
+        asyncio.run_coroutine_threadsafe(self._connection.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+    def __getattr__(self, target_class):
+        if target_class[0] == "_":
+            raise AttributeError(target_class)
+        return self.target(target_class)
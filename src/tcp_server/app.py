@@ -52,7 +52,22 @@ try:
                "in the configuration file.")
         raise NotImplementedError(msg)
 
-    run_server(ip, port, served_objects)
+    # optional limits for the memory used by objects kept for the clients, empty values disable them
+    memory_budget = config["server"].get("MemoryBudgetMB", "")
+    memory_budget = int(float(memory_budget) * 2 ** 20) if memory_budget else None
+    variable_ttl = config["server"].get("VariableTTL", "")
+    variable_ttl = float(variable_ttl) if variable_ttl else None
+    measurement_cache = config["server"].get("MeasurementCacheMB", "")
+    measurement_cache = int(float(measurement_cache) * 2 ** 20) if measurement_cache else None
+    measurement_ttl = config["server"].get("MeasurementTTL", "")
+    measurement_ttl = float(measurement_ttl) if measurement_ttl else None
+    lpt.set_measurement_cache_limits(measurement_cache, measurement_ttl)
+
+    # optional local port that answers with the server metrics as plain text
+    metrics_port = config["server"].get("MetricsPort", "")
+    metrics_port = int(metrics_port) if metrics_port else None
+
+    run_server(ip, port, served_objects, memory_budget, variable_ttl, metrics_port)
 except Exception:
     traceback.print_exc()
     import msvcrt
@@ -1,75 +1,1428 @@
+import array
 import asyncio
+import base64
+import concurrent.futures
+import ctypes
+import inspect
 import json
-import builtins
+import math
+import socket
+import struct
+import threading
+import time
 import traceback
 import sys
-from typing import Dict, Any, Optional
+import zlib
+from collections import OrderedDict, deque
+from typing import AsyncIterator, Callable, Dict, Any, Iterator, Optional, Tuple, Union
 from tblib import Traceback
 import logging
 
+# lzma is missing in some Python builds, zlib is always available
+try:
+    import lzma
+    lzma_imported = True
+except ModuleNotFoundError:
+    lzma_imported = False
+
+# orjson is optional and only used to speed up the parsing and serialization of messages
+try:
+    import orjson
+    orjson_imported = True
+except ModuleNotFoundError:
+    orjson_imported = False
+
+# maximum length of a single message, the default limit of asyncio streams (64 KiB) is too small for waveform data
+MESSAGE_LIMIT = 2 ** 28
+
+# number of requests of a connection that are read ahead while the earlier ones are still being executed
+PIPELINE_DEPTH = 64
+
+# Version 1 are newline-delimited JSON messages. Version 2 adds the handshake, with which a client can switch its
+# connection to length-prefixed frames.
+PROTOCOL_VERSION = 2
+FRAMINGS = ("line", "length")
+
+FRAME_HEADER = struct.Struct("!II")
+"""Header of a length-prefixed frame: the lengths of the JSON part and of the binary part that follow it. The
+binary part contains the data of the packed arrays of a response."""
+
+COMPRESSORS = {"zlib": zlib.compress}
+"""Codecs that clients can request for the compression of responses."""
+if lzma_imported:
+    COMPRESSORS["lzma"] = lzma.compress
+
+
+def loads_json(data):
+    if orjson_imported:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # e.g. NaN, which is written by the json module of the clients, but is not valid JSON
+            pass
+    return json.loads(data)
+
+
+def dumps_json(obj, attachments: Optional[list] = None) -> str:
+    """Serialize a message.
+
+    The data of packed arrays (bytes) is encoded as base64. If a list of attachments is given, the data is appended to
+    it instead and replaced by its offset and length within the binary part of the frame.
+    """
+    offset = 0
+
+    def encode_bytes(value):
+        nonlocal offset
+        if not isinstance(value, bytes):
+            raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+        if attachments is None:
+            return base64.b64encode(value).decode("ascii")
+        reference = {"offset": offset, "length": len(value)}
+        attachments.append(value)
+        offset += len(value)
+        return reference
+
+    if orjson_imported:
+        try:
+            return orjson.dumps(obj, default=encode_bytes).decode("utf-8")
+        except TypeError:
+            # e.g. integers beyond 64 bit or dictionaries with keys that are not strings
+            if attachments is not None:
+                attachments.clear()
+                offset = 0
+    return json.dumps(obj, default=encode_bytes)
+
+
+def object_size(obj) -> int:
+    """Return the memory used by an object. For ctypes objects, the size of the underlying buffer is used."""
+    try:
+        return ctypes.sizeof(obj)
+    except TypeError:
+        return sys.getsizeof(obj)
+
+
+class MemoryBudget:
+    """
+    The memory budget (in bytes) of the objects in the variable stores of all sessions.
+
+    When the total size of the objects exceeds it, the least recently used objects of all stores are evicted, so the
+    budget bounds the memory of the server however many clients use it. The stores share the lock of the budget.
+    """
+
+    def __init__(self, limit: Optional[int] = None):
+        self.limit = limit
+        self.memory = 0
+        self.stores: set = set()
+        self.lock = threading.RLock()
+        self._uses = 0
+
+    def next_use(self) -> int:
+        """Return a number that orders the uses of the objects of all stores."""
+        with self.lock:
+            self._uses += 1
+            return self._uses
+
+    def evict(self):
+        """Evict the least recently used objects of all stores while the memory exceeds the limit."""
+        if self.limit is None:
+            return
+        with self.lock:
+            while self.memory > self.limit:
+                stores = [store for store in self.stores if len(store) > 0]
+                # the most recently added object is kept, even if it exceeds the budget on its own
+                if sum(map(len, stores)) <= 1:
+                    break
+                store = min(stores, key=VariableStore.oldest_use)
+                store._evict(next(iter(store._variables)), f"the memory budget of {self.limit} bytes was exceeded")
+
+
+class VariableStore:
+    """
+    The objects that are kept by the server for a session and referenced by RemoteVars of its clients.
+
+    With a memory budget, the least recently used objects of all stores that share the budget are evicted when their
+    total size exceeds it, see MemoryBudget. A budget given in bytes is only used by this store. With a ttl (in
+    seconds), objects that have not been used for longer are evicted. Using an evicted reference raises a KeyError
+    that says so.
+
+    The store is used by the event loop and the instrument thread, all access is guarded by the lock of the budget.
+    """
+
+    # number of evicted names that are remembered to give a clear error message
+    evicted_names_limit = 10000
+
+    def __init__(self, memory_budget: Union[MemoryBudget, int, None] = None, ttl: Optional[float] = None):
+        if not isinstance(memory_budget, MemoryBudget):
+            memory_budget = MemoryBudget(memory_budget)
+        self.budget = memory_budget
+        self.ttl = ttl
+        self.memory = 0
+        self._count = 0
+        # name -> (object, size, time of last use, number of last use), ordered from least to most recently used
+        self._variables: OrderedDict = OrderedDict()
+        self._evicted: OrderedDict = OrderedDict()
+        self._lock = memory_budget.lock
+        with self._lock:
+            memory_budget.stores.add(self)
+
+    def __len__(self) -> int:
+        return len(self._variables)
+
+    def oldest_use(self) -> int:
+        """Return the number of the last use of the least recently used object, see MemoryBudget.next_use."""
+        return next(iter(self._variables.values()))[3]
+
+    def add(self, obj) -> str:
+        """Store an object and return the name to reference it."""
+        size = object_size(obj)
+        with self._lock:
+            self._count += 1
+            name = str(self._count)
+            self._variables[name] = (obj, size, time.monotonic(), self.budget.next_use())
+            self.memory += size
+            self.budget.memory += size
+            self.evict()
+        return name
+
+    def get(self, name: str):
+        with self._lock:
+            try:
+                obj, size, _, _ = self._variables[name]
+            except KeyError:
+                if name in self._evicted:
+                    raise KeyError(f"The object of RemoteVar {name} has been evicted from the server, because "
+                                   f"{self._evicted[name]}.") from None
+                raise KeyError(f"The object of RemoteVar {name} is unknown to the server or has been "
+                               f"released.") from None
+            self._variables[name] = (obj, size, time.monotonic(), self.budget.next_use())
+            self._variables.move_to_end(name)
+        return obj
+
+    def release(self, name: str):
+        """Delete an object. Unknown names are ignored."""
+        with self._lock:
+            entry = self._variables.pop(name, None)
+            if entry is not None:
+                self.memory -= entry[1]
+                self.budget.memory -= entry[1]
+
+    def close(self):
+        """Delete all objects and stop using the memory budget, when the session is discarded."""
+        with self._lock:
+            for name in list(self._variables):
+                self.release(name)
+            self.budget.stores.discard(self)
+
+    def evict(self):
+        """Remove objects that exceed the ttl or the memory budget, the least recently used first."""
+        with self._lock:
+            if self.ttl is not None:
+                oldest_allowed = time.monotonic() - self.ttl
+                while self._variables:
+                    name, (_, _, last_use, _) = next(iter(self._variables.items()))
+                    if last_use >= oldest_allowed:
+                        break
+                    self._evict(name, f"it was not used for more than {self.ttl} s")
+            self.budget.evict()
+
+    def _evict(self, name: str, reason: str):
+        self.release(name)
+        logging.info(f"RemoteVar {name} evicted, because {reason}.")
+        self._evicted[name] = reason
+        if len(self._evicted) > self.evicted_names_limit:
+            self._evicted.popitem(last=False)
+
+
+class ClientSession:
+    """
+    The state that the server keeps for a client: the objects referenced by its RemoteVars and its background jobs.
+
+    Clients name their session in the "session" field of their commands, and all connections with the same name share
+    it. Commands without a session name use the shared default session.
+    """
+
+    def __init__(self, name: Optional[str], memory_budget: Union[MemoryBudget, int, None] = None,
+                 ttl: Optional[float] = None):
+        self.name = name
+        self.variables = VariableStore(memory_budget, ttl)
+        # futures of the responses of the jobs whose results have not been collected yet, by job id
+        self.jobs: Dict[str, concurrent.futures.Future] = {}
+        # number of open connections that have used the session
+        self.connections = 0
+        # time.monotonic() when the last connection of the session was closed
+        self.idle_since = time.monotonic()
+
+
+class InstrumentScheduler:
+    """
+    Executes the calls of the served objects in a single thread.
+
+    Every session has its own queue whose calls are executed in order. The queues of the sessions are served
+    round-robin, one call at a time, so a client that queued a long sweep does not hold back the short queries of
+    others. A session that holds the instrument lock is served exclusively until it releases the lock.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        # session -> deque of (future, function, args, deadline, abort), in the order the sessions are served next
+        self._queues: OrderedDict = OrderedDict()
+        self._thread: Optional[threading.Thread] = None
+        self.owner: Optional[ClientSession] = None
+        # the future of the call that is running, it is only changed with the abort lock, see abort
+        self._running: Optional[concurrent.futures.Future] = None
+        self._abort_lock = threading.Lock()
+        # number of calls that were dropped or aborted because of their deadline
+        self.dropped = 0
+        self.aborted = 0
+
+    def submit(self, session: ClientSession, function, *args, deadline: Optional[float] = None,
+               abort: Optional[Callable] = None) -> concurrent.futures.Future:
+        """Queue a call for the session and return a future of its result.
+
+        If the deadline (in time.monotonic() seconds) has passed before the call is started, the call is dropped and
+        the future fails with a TimeoutError. If the call is still running at the deadline, abort is called from
+        another thread, e.g. dev_abort to end a running pulse test.
+        """
+        future = concurrent.futures.Future()
+        with self._condition:
+            self._queues.setdefault(session, deque()).append((future, function, args, deadline, abort))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="instrument", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return future
+
+    def queue_length(self) -> int:
+        with self._condition:
+            return sum(len(queue) for queue in self._queues.values())
+
+    def acquire(self, session: ClientSession):
+        """Give the session the exclusive use of the instrument. Only called in the instrument thread."""
+        with self._condition:
+            self.owner = session
+
+    def release(self, session: ClientSession):
+        """Release the instrument lock if it is held by the session."""
+        with self._condition:
+            if self.owner is session:
+                self.owner = None
+                self._condition.notify()
+
+    def _next_call(self):
+        with self._condition:
+            while True:
+                if self.owner is None:
+                    if self._queues:
+                        session = next(iter(self._queues))
+                        break
+                elif self._queues.get(self.owner):
+                    session = self.owner
+                    break
+                self._condition.wait()
+            queue = self._queues[session]
+            call = queue.popleft()
+            if queue:
+                self._queues.move_to_end(session)
+            else:
+                del self._queues[session]
+            return call
+
+    def _run(self):
+        while True:
+            future, function, args, deadline, abort = self._next_call()
+            if not future.set_running_or_notify_cancel():
+                continue
+            if deadline is not None and time.monotonic() >= deadline:
+                with self._condition:
+                    self.dropped += 1
+                future.set_exception(TimeoutError("The call was dropped, because its deadline passed in the queue."))
+                continue
+            with self._abort_lock:
+                self._running = future
+            timer = None
+            if deadline is not None and abort is not None:
+                timer = threading.Timer(deadline - time.monotonic(), self._abort_at_deadline, (future, abort))
+                timer.daemon = True
+                timer.start()
+            try:
+                result = function(*args)
+            except BaseException as e:
+                exception, result = e, None
+            else:
+                exception = None
+            if timer is not None:
+                timer.cancel()
+            # waits for an abort in progress, so it cannot hit the next call
+            with self._abort_lock:
+                self._running = None
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
+
+    def drop(self, future: concurrent.futures.Future) -> bool:
+        """Cancel a queued call whose deadline has passed, return False if it has already been started."""
+        if not future.cancel():
+            return False
+        with self._condition:
+            self.dropped += 1
+        return True
+
+    def abort(self, future: concurrent.futures.Future, abort: Callable) -> bool:
+        """Call abort in the calling thread if the call of the future is running, e.g. dev_abort to end a running
+        pulse test, and return whether it was called.
+
+        The next call is only started when abort has returned, so it can never end the call of another client.
+        """
+        with self._abort_lock:
+            if self._running is not future:
+                return False
+            try:
+                abort()
+            except Exception:
+                logging.exception("The running call could not be aborted.")
+            return True
+
+    def _abort_at_deadline(self, future: concurrent.futures.Future, abort: Callable):
+        if self.abort(future, abort):
+            with self._condition:
+                self.aborted += 1
+
+
+class FunctionMetrics:
+    """Number, failures and execution times of the calls of one served function."""
+
+    # number of the most recent execution times that the percentiles are computed from
+    samples_limit = 1000
+
+    def __init__(self):
+        self.calls = 0
+        self.exceptions = 0
+        self.time = 0.0
+        self.max_time = 0.0
+        self.recent_times: deque = deque(maxlen=self.samples_limit)
+
+    def snapshot(self) -> Dict[str, Any]:
+        times = sorted(self.recent_times)
+
+        def percentile(fraction: float) -> Optional[float]:
+            return times[min(int(fraction * len(times)), len(times) - 1)] if times else None
+
+        return {
+            "calls": self.calls,
+            "exceptions": self.exceptions,
+            "time": self.time,
+            "max": self.max_time,
+            "p50": percentile(0.5),
+            "p90": percentile(0.9),
+            "p99": percentile(0.99),
+        }
+
+
+class ServerMetrics:
+    """
+    Counters of the server that help to find bottlenecks: the calls of the served functions with their execution
+    times, the time spent for serializing responses, and the exceptions.
+
+    The counters are updated by the event loop and the instrument thread and are guarded by a lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.start_time = time.time()
+        self.functions: Dict[str, FunctionMetrics] = {}
+        self.exceptions: Dict[str, int] = {}
+        self.responses = 0
+        self.exception_responses = 0
+        self.serialization_time = 0.0
+        self.connections = 0
+
+    def record_call(self, function: str, duration: float, exception: Optional[BaseException] = None):
+        """Record a call of a served function, given as "class.function"."""
+        with self._lock:
+            metrics = self.functions.get(function)
+            if metrics is None:
+                metrics = self.functions[function] = FunctionMetrics()
+            metrics.calls += 1
+            metrics.time += duration
+            metrics.max_time = max(metrics.max_time, duration)
+            metrics.recent_times.append(duration)
+            if exception is not None:
+                metrics.exceptions += 1
+                name = type(exception).__name__
+                self.exceptions[name] = self.exceptions.get(name, 0) + 1
+
+    def record_response(self, duration: float, failed: bool):
+        """Record a response and the time spent to serialize and compress it."""
+        with self._lock:
+            self.responses += 1
+            self.serialization_time += duration
+            if failed:
+                self.exception_responses += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "uptime": time.time() - self.start_time,
+                "connections": self.connections,
+                "responses": self.responses,
+                "exception_responses": self.exception_responses,
+                "serialization_time": self.serialization_time,
+                "exceptions": dict(self.exceptions),
+                "functions": {name: metrics.snapshot() for name, metrics in self.functions.items()},
+            }
+
+
+def format_metrics(metrics: Dict[str, Any], prefix: str = "") -> str:
+    """Format the metrics as plain text with one "name value" line per value, nested names are joined by dots."""
+    lines = []
+    for name, value in metrics.items():
+        if isinstance(value, dict):
+            lines.append(format_metrics(value, f"{prefix}{name}."))
+        else:
+            lines.append(f"{prefix}{name} {value}\n")
+    return "".join(lines)
+
 
 class Server:
     _target_classes: Dict[str, object]
-    _local_variables: Dict[str, Any]
-    _local_variable_count: int
+    _local_variables: VariableStore
+
+    # types of attributes that are considered constants and are returned by get_namespace
+    _namespace_types = (int, float, str, bool)
+
+    # converters of the arguments that are sent by value, by the type name used in the protocol
+    _argument_converters: Dict[str, Callable] = {
+        "int": int,
+        "float": float,
+        "str": str,
+        "bool": bool,
+        "dict": dict,
+    }
+
+    # types of results that are sent by value, all others are kept by the server and referenced by a RemoteVar
+    _value_types = frozenset((int, float, str, bool, dict, type(None)))
+
+    # Lists with at least this many elements that only contain floats or only ints are sent as packed binary arrays
+    # to clients that request it. Shorter lists are sent element by element.
+    packed_array_min_length = 16
+
+    # shortest and default longest interval in seconds between the calls of a function that is polled
+    poll_min_interval = 0.001
+    poll_max_interval = 0.02
+
+    # maximum number of jobs of a session whose results have not been collected
+    max_jobs = 256
+
+    # seconds after which a session without connections is discarded together with its objects and jobs
+    session_ttl = 3600.0
 
-    def __init__(self, served_objects: Dict[str, Any]):
+    # number of elements per chunk when a list result is streamed and the client did not choose a chunk size
+    stream_chunk_size = 65536
+
+    # responses of at least this many characters are compressed for clients that accept a compression codec
+    compression_threshold = 4096
+
+    def __init__(self, served_objects: Dict[str, Any], memory_budget: Optional[int] = None,
+                 variable_ttl: Optional[float] = None):
         self._target_classes = served_objects
-        self._local_variable_count = 0
-        self._local_variables = {}
+        # the functions that clients may call, by served object and name
+        self._functions: Dict[str, Dict[str, Callable]] = {
+            target_class: self.functions_of(target) for target_class, target in served_objects.items()
+        }
+        # shared by the sessions, so that the budget bounds the memory of all clients together
+        self.memory_budget = MemoryBudget(memory_budget)
+        self.variable_ttl = variable_ttl
+        self._default_session = ClientSession(None, self.memory_budget, variable_ttl)
+        self._local_variables = self._default_session.variables
+        self._sessions: Dict[str, ClientSession] = {}
+        self._schemas: Dict[str, Dict[str, Any]] = {}
+        self._job_count = 0
+        self.compression_statistics = {
+            "responses": 0,
+            "uncompressed_bytes": 0,
+            "compressed_bytes": 0,
+            "time": 0.0,
+        }
+        # The served objects are only called from the thread of the scheduler, so that a long measurement does not
+        # block the event loop.
+        self.scheduler = InstrumentScheduler()
+        self.metrics = ServerMetrics()
 
     def return_target(self, target_class: str):
         return self._target_classes[target_class]
 
-    def convert_argument_from_json(self, arg):
+    def return_function(self, target_class: str, function: str) -> Callable:
+        try:
+            return self._functions[target_class][function]
+        except KeyError:
+            if target_class not in self._functions:
+                raise KeyError(f"There is no served object {target_class}.") from None
+            raise AttributeError(f"{target_class} has no public function {function}.") from None
+
+    @staticmethod
+    def functions_of(target) -> Dict[str, Callable]:
+        """Return the public functions of a served object."""
+        functions = {}
+        for name in dir(target):
+            if name.startswith("_"):
+                continue
+            function = getattr(target, name)
+            if inspect.isroutine(function):
+                functions[name] = function
+        return functions
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Return the metrics of the server, including the queued calls and the objects kept for the clients."""
+        metrics = self.metrics.snapshot()
+        sessions = [self._default_session, *self._sessions.values()]
+        metrics["sessions"] = len(self._sessions)
+        metrics["queue_length"] = self.scheduler.queue_length()
+        metrics["remote_vars"] = {
+            "count": sum(len(session.variables) for session in sessions),
+            "memory": sum(session.variables.memory for session in sessions),
+        }
+        metrics["jobs"] = sum(len(session.jobs) for session in sessions)
+        metrics["deadlines"] = {
+            "dropped": self.scheduler.dropped,
+            "aborted": self.scheduler.aborted,
+        }
+        metrics["compression"] = dict(self.compression_statistics)
+        return metrics
+
+    def get_session(self, name: Optional[str]) -> ClientSession:
+        """Return the session with the given name, it is created with the first use."""
+        if name is None:
+            return self._default_session
+        session = self._sessions.get(name)
+        if session is None:
+            self.expire_sessions()
+            session = self._sessions[name] = ClientSession(name, self.memory_budget, self.variable_ttl)
+        return session
+
+    def open_session(self, name: Optional[str], connection_sessions: set) -> ClientSession:
+        """Return the session of a command and count the connection as user of the session."""
+        session = self.get_session(name)
+        if session not in connection_sessions:
+            connection_sessions.add(session)
+            session.connections += 1
+        return session
+
+    def close_sessions(self, connection_sessions: set):
+        """Called when a connection is closed with the sessions it has used.
+
+        When the last connection of a session is closed, the instrument lock of the session is released after its
+        queued calls, and the session is discarded if it does not keep any objects or jobs. Otherwise it is kept for
+        session_ttl seconds, so that the client can reconnect, see expire_sessions.
+        """
+        for session in connection_sessions:
+            session.connections -= 1
+            if session.connections > 0:
+                continue
+            session.idle_since = time.monotonic()
+            if self.scheduler.owner is session:
+                self.scheduler.submit(session, self.scheduler.release, session)
+            if session.name is not None and len(session.variables) == 0 and not session.jobs:
+                self.discard_session(session)
+        self.expire_sessions()
+
+    def expire_sessions(self):
+        """Discard the sessions that have had no connection for more than session_ttl seconds, with their objects.
+
+        Clients do not release their objects when they exit, so the sessions of clients that are gone would be kept
+        forever otherwise. Sessions with jobs that are still queued or running are kept until the jobs have finished.
+        """
+        oldest_allowed = time.monotonic() - self.session_ttl
+        for session in list(self._sessions.values()):
+            if (session.connections == 0 and session.idle_since < oldest_allowed
+                    and all(future.done() for future in session.jobs.values())):
+                logging.info(f"Session {session.name} expired with {len(session.variables)} objects and "
+                             f"{len(session.jobs)} jobs.")
+                self.discard_session(session)
+
+    def discard_session(self, session: ClientSession):
+        self._sessions.pop(session.name, None)
+        session.jobs.clear()
+        session.variables.close()
+
+    def convert_argument_from_json(self, arg, session: Optional[ClientSession] = None, results: Optional[list] = None):
         if isinstance(arg, list):
-            return [self.convert_argument_from_json(element) for element in arg]
+            return [self.convert_argument_from_json(element, session, results) for element in arg]
         arg_type = arg["type"]
-        arg_value = arg["value"]
+        converter = self._argument_converters.get(arg_type)
+        if converter is not None:
+            return converter(arg["value"])
         if arg_type == "RemoteVar":
-            return self._local_variables[str(arg_value)]
+            session = session or self._default_session
+            return session.variables.get(str(arg["value"]))
         elif arg_type == "NoneType":
             return None
-        return getattr(builtins, arg_type)(arg_value)
+        elif arg_type == "array":
+            return self.unpack_array(arg).tolist()
+        elif arg_type == "Result":
+            return self.resolve_result(arg, results)
+        raise TypeError(f"Arguments of type {arg_type} are not supported.")
+
+    @staticmethod
+    def resolve_result(arg: Dict[str, Any], results: Optional[list]):
+        """Return the value of a reference to the result of an earlier call of the same batch.
 
-    def convert_argument_to_json(self, arg):
+        The optional "item" is a list of indices that select an element of the result, and the optional "offset" is
+        added to it.
+        """
+        index = arg["value"]
+        if results is None or not 0 <= index < len(results):
+            raise ValueError(f"The result of call {index} is not available. Only the results of earlier calls of the "
+                             f"same batch can be used as arguments.")
+        value = results[index]
+        for item in arg.get("item", []):
+            value = value[item]
+        if "offset" in arg:
+            value = value + arg["offset"]
+        return value
+
+    def convert_argument_to_json(self, arg, packed: bool = False, session: Optional[ClientSession] = None):
         # tuples become lists in json anyway, so treat them the same here
-        if isinstance(arg, list) or isinstance(arg, tuple):
-            return [self.convert_argument_to_json(element) for element in arg]
-        arg_type = type(arg).__name__
-        # complex types are not transferred but saved locally and only a reference is sent back
-        if not hasattr(builtins, arg_type) and arg_type != "NoneType":
-            self._local_variable_count += 1
-            self._local_variables[str(self._local_variable_count)] = arg
-            arg_type = "RemoteVar"
-            arg = str(self._local_variable_count)
+        if isinstance(arg, (list, tuple)):
+            if packed:
+                packed_array = self.pack_array(arg)
+                if packed_array is not None:
+                    return packed_array
+            return [self.convert_argument_to_json(element, packed, session) for element in arg]
+        arg_type = type(arg)
+        if arg_type not in self._value_types:
+            # complex types are not transferred but saved locally and only a reference is sent back
+            session = session or self._default_session
+            return {
+                "type": "RemoteVar",
+                "value": session.variables.add(arg)
+            }
+        if arg_type is float and not math.isfinite(arg):
+            # NaN and infinity are not valid JSON, float() of the clients accepts them as strings
+            arg = repr(arg)
         return {
-            "type": arg_type,
+            "type": arg_type.__name__,
             "value": arg
         }
 
+    def pack_array(self, arg) -> Optional[Dict[str, Any]]:
+        """Return the packed binary representation of a list of floats or ints, or None if it cannot be packed."""
+        if len(arg) < self.packed_array_min_length:
+            return None
+        element_type = type(arg[0])
+        if element_type is float:
+            typecode = "d"
+        elif element_type is int:
+            typecode = "q"
+        else:
+            return None
+        # all elements must have the type of the first one, set and map are much faster than a loop for long lists
+        if len(set(map(type, arg))) != 1:
+            return None
+        try:
+            data = array.array(typecode, arg)
+        except OverflowError:
+            return None
+        # the bytes are encoded when the response is serialized, depending on the framing of the connection
+        return {
+            "type": "array",
+            "typecode": typecode,
+            "byteorder": sys.byteorder,
+            "value": data.tobytes()
+        }
+
+    @staticmethod
+    def unpack_array(arg: Dict[str, Any]) -> array.array:
+        data = array.array(arg["typecode"])
+        data.frombytes(base64.b64decode(arg["value"]))
+        if arg["byteorder"] != sys.byteorder:
+            data.byteswap()
+        return data
+
     def run_command(self, command: str) -> str:
-        command_json = json.loads(command)
+        """Execute a single command and return the response.
+
+        If the command carries an "id", it is copied to the response so that clients with several requests in flight
+        can match the responses to their requests.
+        """
+        request_id = None
+        compression = None
+        try:
+            command_json = loads_json(command)
+            request_id = command_json.get("id")
+            compression = command_json.get("compression")
+            response = self.execute_command(command_json, self.get_session(command_json.get("session")))
+        except Exception:
+            response = exception_response()
+        return self.serialize_response(response, request_id, compression)
+
+    async def process_command(self, command: bytes, connection_sessions: set,
+                              framing: str = "line") -> Union[bytes, AsyncIterator[bytes]]:
+        """Execute a single command like run_command, but without blocking the event loop, and return the framed
+        response.
+
+        Commands that call the served objects, release variables or lock the instrument are queued at the scheduler
+        and executed in the instrument thread. Everything else, including parsing and serialization, is done in the
+        event loop, so the server keeps answering other connections while a measurement is running.
+
+        For a function call with "stream", an async iterator over the framed messages of the stream is returned, see
+        stream_responses. The calls of a command with a "deadline" are queued with it, see call_limits.
+        """
+        request_id = None
+        compression = None
+        try:
+            command_json = loads_json(command)
+            request_id = command_json.get("id")
+            compression = command_json.get("compression")
+            session = self.open_session(command_json.get("session"), connection_sessions)
+            limits = self.call_limits(command_json)
+            if limits:
+                # the releases are queued without the deadline, so that they are done even if the call is dropped
+                self.queue_releases(command_json, session)
+            if "job_id" in command_json and command_json.get("action") == "result":
+                await self.wait_for_job(command_json, session)
+            if "lock" in command_json:
+                response = await self.run_queued(session, limits, self.lock_instrument, command_json, session)
+            elif self.is_poll(command_json):
+                response = await self.poll_function(command_json, session, limits)
+            elif self.is_timed_repeat(command_json):
+                response = await self.repeat_function(command_json, session, limits)
+            elif self.is_stream(command_json):
+                chunks = await self.run_queued(session, limits, self.start_stream, command_json, session)
+                return self.stream_responses(chunks, command_json, session, framing, limits)
+            elif self.uses_instrument(command_json):
+                response = await self.run_queued(session, limits, self.execute_command, command_json, session)
+            else:
+                response = self.execute_command(command_json, session)
+        except Exception:
+            response = exception_response()
+        return self.frame_response(response, request_id, compression, framing)
+
+    async def run_queued(self, session: ClientSession, limits: Dict[str, Any], function, *args):
+        """Queue a call at the scheduler with the limits of its command, see call_limits, and wait for its result.
+
+        A call that has not been started at its deadline is taken out of the queue right away, so the client does not
+        wait for the end of the calls before it to learn that its request was dropped.
+        """
+        future = self.scheduler.submit(session, function, *args, **limits)
+        if "deadline" not in limits:
+            return await asyncio.wrap_future(future)
+        result = asyncio.wrap_future(future)
+        try:
+            # shielded, so that a running call is not cancelled when the deadline has passed
+            return await asyncio.wait_for(asyncio.shield(result), max(limits["deadline"] - time.monotonic(), 0.0))
+        except asyncio.TimeoutError:
+            if self.scheduler.drop(future):
+                raise TimeoutError("The call was dropped, because its deadline passed in the queue.") from None
+        return await result
+
+    def queue_releases(self, command_json: Dict[str, Any], session: ClientSession):
+        """Queue the release of the variables named in a command as a call of its own and remove them from the
+        command.
+
+        The client does not send these names again, so the objects would be kept forever if the release was done by
+        a call that is dropped or cancelled.
+        """
+        if "release" in command_json:
+            self.scheduler.submit(session, self.release_variables, command_json.pop("release"), session)
+
+    def call_limits(self, command_json: Dict[str, Any]) -> Dict[str, Any]:
+        """Return the deadline and the abort function of a command as keyword arguments of InstrumentScheduler.submit.
+
+        "deadline" is the time in seconds from the reception of the command within which its calls have to be started,
+        otherwise they are dropped without calling the served object. "abort" names a function of the target, e.g.
+        dev_abort, that is called if a call of the command is still running at the deadline. It is ignored for targets
+        without this function.
+        """
+        if "deadline" not in command_json:
+            return {}
+        limits = {"deadline": time.monotonic() + float(command_json["deadline"])}
+        abort = command_json.get("abort")
+        if abort is not None and "class" in command_json:
+            limits["abort"] = self._functions.get(command_json["class"], {}).get(abort)
+        return limits
+
+    def frame_response(self, response: Dict[str, Any], request_id=None, compression: Optional[list] = None,
+                       framing: str = "line") -> bytes:
+        """Serialize a response and frame it for a connection with the given framing."""
+        if framing == "line":
+            return self.serialize_response(response, request_id, compression).encode("utf-8") + b"\n"
+        attachments = []
+        # the JSON and the binary part are compressed together, see compress_frame
+        data = self.serialize_response(response, request_id, attachments=attachments).encode("utf-8")
+        binary_length = sum(map(len, attachments))
+        if compression and len(data) + binary_length >= self.compression_threshold:
+            frame = self.compress_frame(data, attachments, compression, request_id)
+            if frame is not None:
+                return frame
+        return b"".join([FRAME_HEADER.pack(len(data), binary_length), data, *attachments])
+
+    @staticmethod
+    def is_poll(command_json: Dict[str, Any]) -> bool:
+        return "poll" in command_json and "function" in command_json and "job" not in command_json
+
+    async def poll_function(self, command_json: Dict[str, Any], session: ClientSession,
+                            limits: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Call a function until its result differs from a value, e.g. to wait for the end of a pulse test with
+        "poll": {"while": {"type": "int", "value": 1}, "item": 0, "timeout": 10, "abort": "dev_abort"}.
+
+        With "item", the element of the result with this index is compared. The function is called every millisecond
+        at first, and for longer waits the interval grows with the elapsed time up to "max_interval" seconds. Each
+        call is queued at the scheduler on its own and the waiting is done in the event loop, so the instrument thread
+        executes the calls of other clients in between. The response contains the last result. If the value has not
+        changed after "timeout" seconds, the function "abort" of the same target is called if given, and a
+        TimeoutError is raised. The deadline of the command, see call_limits, ends the polling in the same way.
+        """
+        limits = limits or {}
+        poll = command_json["poll"]
+        value = self.convert_argument_from_json(poll["while"], session)
+        item = poll.get("item")
+        max_interval = poll.get("max_interval", self.poll_max_interval)
+        start = time.monotonic()
+        end = min(start + poll.get("timeout", math.inf), limits.get("deadline", math.inf))
+        abort = limits.get("abort")
+        if "abort" in poll:
+            abort = self.return_function(command_json["class"], poll["abort"])
+        while True:
+            # the polls are not dropped at the deadline, so that the abort below is not skipped
+            result = await asyncio.wrap_future(
+                self.scheduler.submit(session, self.release_and_call, command_json, session))
+            if (result if item is None else result[item]) != value:
+                break
+            now = time.monotonic()
+            if now > end:
+                if abort is not None:
+                    await asyncio.wrap_future(self.scheduler.submit(session, abort))
+                raise TimeoutError(
+                    f"The result of {command_json['function']} was still {value!r} after {now - start:.3f} s.")
+            interval = min(max_interval, max(self.poll_min_interval, (now - start) * 0.05))
+            await asyncio.sleep(min(interval, max(end - now, 0.0)))
+        return {
+            "status": "success",
+            "return": self.convert_argument_to_json(result, command_json.get("packed", False), session)
+        }
+
+    @staticmethod
+    def is_timed_repeat(command_json: Dict[str, Any]) -> bool:
+        return ("repeat" in command_json and command_json.get("interval") and "function" in command_json
+                and "job" not in command_json)
+
+    async def repeat_function(self, command_json: Dict[str, Any], session: ClientSession,
+                              limits: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Call a function "repeat" times at a fixed "interval" in seconds, with the response of run_repeated.
+
+        Each call is queued at the scheduler on its own and the waiting for the next start is done in the event loop,
+        like in poll_function, so the instrument thread executes the calls of other clients in between. A call that
+        is dropped at the deadline of the command ends the repetitions with a TimeoutError.
+        """
+        count = self.repetitions(command_json)
+        interval = command_json["interval"]
+        values = []
+        timestamps = []
+        start = time.perf_counter()
+        # the times are measured with the monotonic clock and converted to the system time once
+        epoch_offset = time.time() - start
+        for index in range(count):
+            delay = start + index * interval - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            call_start, value = await self.run_queued(session, limits or {}, self.timed_release_and_call,
+                                                      command_json, session)
+            values.append(value)
+            timestamps.append(epoch_offset + call_start)
+        return {
+            "status": "success",
+            "return": self.convert_argument_to_json([values, timestamps], command_json.get("packed", False), session)
+        }
+
+    def timed_release_and_call(self, command_json: Dict[str, Any],
+                               session: Optional[ClientSession] = None) -> Tuple[float, Any]:
+        """Call the function of a command like release_and_call and return the time.perf_counter() at the start of
+        the call together with its result."""
+        start = time.perf_counter()
+        return start, self.release_and_call(command_json, session)
+
+    @staticmethod
+    def is_stream(command_json: Dict[str, Any]) -> bool:
+        return ("stream" in command_json and "function" in command_json and "repeat" not in command_json
+                and "job" not in command_json)
+
+    def start_stream(self, command_json: Dict[str, Any], session: Optional[ClientSession] = None) -> Iterator:
+        """Call a function and return an iterator over the chunks of its result, see stream_responses."""
+        result = self.release_and_call(command_json, session)
+        return self.chunks_of(result, command_json.get("chunk_size", self.stream_chunk_size))
+
+    @staticmethod
+    def chunks_of(result, chunk_size: int) -> Iterator:
+        """Return an iterator over the chunks of a result.
+
+        Iterators, e.g. of generator functions, are streamed item by item. Lists, tuples and arrays are sliced into
+        chunks of chunk_size elements. If all their elements are sequences, e.g. the voltages, currents, times and
+        statuses returned by pulse_fetch, these are sliced in parallel. Any other result is a single chunk.
+        """
+        if not isinstance(chunk_size, int) or chunk_size < 1:
+            raise ValueError(f"The chunk size must be a positive integer, not {chunk_size!r}.")
+        sequences = (list, tuple, array.array)
+        if isinstance(result, Iterator):
+            return result
+        if not isinstance(result, sequences):
+            return iter([result])
+        if result and all(isinstance(column, sequences) for column in result):
+            length = max(map(len, result))
+            return (type(result)(column[start:start + chunk_size] for column in result)
+                    for start in range(0, length, chunk_size))
+        return (result[start:start + chunk_size] for start in range(0, len(result), chunk_size))
+
+    def next_chunk(self, chunks: Iterator, command_json: Dict[str, Any],
+                   session: Optional[ClientSession] = None) -> Optional[Dict[str, Any]]:
+        """Return the message with the next chunk of a stream, or None at its end."""
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            return None
+        return {
+            "status": "success",
+            "chunk": self.convert_argument_to_json(chunk, command_json.get("packed", False), session)
+        }
+
+    async def stream_responses(self, chunks: Iterator, command_json: Dict[str, Any], session: ClientSession,
+                               framing: str = "line", limits: Optional[Dict[str, Any]] = None) -> AsyncIterator[bytes]:
+        """Yield the framed messages of a stream: one message per chunk, each with the id of the request, and a final
+        response with the number of chunks.
+
+        The next chunk is only taken from the iterator when the previous message has been written, so neither the
+        server nor a client that consumes the chunks as they arrive hold more than a few chunks in memory. The chunks
+        are taken in the instrument thread, one scheduled call each, so the calls of other clients are executed in
+        between. An exception ends the stream with an exception response, also a TimeoutError if a chunk could not be
+        taken before the deadline of the command.
+        """
+        limits = limits or {}
+        request_id = command_json.get("id")
+        compression = command_json.get("compression")
+        count = 0
+        try:
+            while True:
+                try:
+                    response = await self.run_queued(session, limits, self.next_chunk, chunks, command_json, session)
+                except Exception:
+                    response = exception_response()
+                if response is None:
+                    response = {
+                        "status": "success",
+                        "return": self.convert_argument_to_json(count),
+                        "stream": True
+                    }
+                is_chunk = "chunk" in response
+                data = self.frame_response(response, request_id, compression, framing)
+                # serialize_response replaces a chunk that cannot be serialized by an exception response
+                if not is_chunk or response.get("status") != "success":
+                    yield data
+                    return
+                count += 1
+                yield data
+        finally:
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                # e.g. a generator that was not exhausted because the connection was lost
+                self.scheduler.submit(session, close)
+
+    def handshake(self, command: bytes) -> Optional[Tuple[bytes, str]]:
+        """Negotiate the framing of a connection with a {"handshake": {"version": ..., "framing": ...}} command.
+
+        Return the response as line and the framing of the following messages in both directions, or None if the
+        command is not a handshake.
+        """
+        request_id = None
+        framing = "line"
+        try:
+            command_json = loads_json(command)
+            if "handshake" not in command_json:
+                return None
+            request_id = command_json.get("id")
+            version = command_json["handshake"].get("version")
+            if version != PROTOCOL_VERSION:
+                raise ValueError(f"Protocol version {version!r} is not supported. The server uses version "
+                                 f"{PROTOCOL_VERSION}.")
+            requested_framing = command_json["handshake"].get("framing", "line")
+            if requested_framing not in FRAMINGS:
+                raise ValueError(f"Framing {requested_framing!r} is not supported. Use one of {list(FRAMINGS)}.")
+            framing = requested_framing
+            response = {
+                "status": "success",
+                "return": {
+                    "version": PROTOCOL_VERSION,
+                    "framing": framing
+                }
+            }
+        except Exception:
+            response = exception_response()
+            # tells the client that the handshake was rejected, servers without handshake answer without a version
+            response["version"] = PROTOCOL_VERSION
+        return self.serialize_response(response, request_id).encode("utf-8") + b"\n", framing
+
+    @staticmethod
+    def uses_instrument(command_json: Dict[str, Any]) -> bool:
+        """Return whether a command has to be executed in the instrument thread."""
+        if "job" in command_json:
+            # only queued, the job is executed later in the instrument thread
+            return False
+        # releases are ordered after the calls that were sent before, which may still use the variables
+        return "function" in command_json or "batch" in command_json or "release" in command_json
+
+    def start_job(self, command_json: Dict[str, Any], session: ClientSession) -> Dict[str, Any]:
+        """Queue a command with "job" in the background and return the id of the job right away.
+
+        The job is executed in the instrument thread like any other call of the session. Its response is kept by the
+        server until the client collects it with a command with the "job_id", see query_job. A "deadline" of the
+        command applies to the start of the job, see call_limits, a job that is dropped fails with a TimeoutError.
+        """
+        if len(session.jobs) >= self.max_jobs:
+            raise RuntimeError(f"The session already has {self.max_jobs} jobs. Collect their results first.")
+        command_json = {key: value for key, value in command_json.items() if key not in ("job", "id")}
+        if "function" not in command_json and "batch" not in command_json:
+            raise ValueError("Only function calls, batches and programs can be run as job.")
+        if "poll" in command_json or "stream" in command_json or self.is_timed_repeat(command_json):
+            raise ValueError("Polls, streams and repeats with interval cannot be run as job.")
+        self.queue_releases(command_json, session)
+        self._job_count += 1
+        job_id = str(self._job_count)
+        session.jobs[job_id] = self.scheduler.submit(session, self.run_job, command_json, session,
+                                                     **self.call_limits(command_json))
+        return {
+            "status": "success",
+            "return": self.convert_argument_to_json(job_id)
+        }
+
+    def run_job(self, command_json: Dict[str, Any], session: ClientSession) -> Dict[str, Any]:
+        try:
+            return self.execute_command(command_json, session)
+        except Exception:
+            return exception_response()
+
+    async def wait_for_job(self, command_json: Dict[str, Any], session: ClientSession):
+        """Wait until a job has finished, at most for the "timeout" of the command in seconds if it is given."""
+        future = session.jobs.get(command_json["job_id"])
+        if future is None:
+            return
+        try:
+            # shielded, so that the job is not cancelled when the timeout has passed
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), command_json.get("timeout"))
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            pass
+
+    @staticmethod
+    def job_status(future: concurrent.futures.Future) -> str:
+        if future.cancelled():
+            return "cancelled"
+        if future.running():
+            return "running"
+        if not future.done():
+            return "queued"
+        if future.exception() is not None:
+            # dropped at its deadline
+            return "failed"
+        return "done" if future.result().get("status") == "success" else "failed"
+
+    def query_job(self, command_json: Dict[str, Any], session: ClientSession) -> Dict[str, Any]:
+        """Handle a command with the "job_id" of a job of the session, depending on its "action":
+
+        "status" returns "queued", "running", "done" or "failed". "cancel" cancels a job that has not been started
+        yet and returns whether it was cancelled. A running job is only cancelled if the command names an "abort"
+        function of its target, e.g. dev_abort, that ends it, see InstrumentScheduler.abort. The objects of its
+        response are released when it has ended. "result" returns the response of a finished job, so a failed job
+        raises its exception at the client. The job is then removed from the server. For a job that has not finished
+        yet, only its "job_status" is returned. process_command waits for the job up to the "timeout" before.
+        """
+        job_id = command_json["job_id"]
+        action = command_json.get("action", "status")
+        future = session.jobs.get(job_id)
+        if future is None:
+            raise KeyError(f"There is no job {job_id!r}, or its result has already been collected.")
+        if action == "status":
+            ret = self.job_status(future)
+        elif action == "cancel":
+            ret = future.cancel()
+            if not ret and "abort" in command_json:
+                abort = self.return_function(command_json["class"], command_json["abort"])
+                ret = self.scheduler.abort(future, abort)
+                if ret:
+                    future.add_done_callback(lambda _: self.release_response(future, session))
+            if ret:
+                del session.jobs[job_id]
+        elif action == "result":
+            if not future.done():
+                return {
+                    "status": "success",
+                    "job_status": self.job_status(future)
+                }
+            del session.jobs[job_id]
+            try:
+                return future.result()
+            except Exception:
+                return exception_response()
+        else:
+            raise ValueError(f"Unknown action {action!r} for a job.")
+        return {
+            "status": "success",
+            "return": self.convert_argument_to_json(ret)
+        }
+
+    def release_response(self, future: concurrent.futures.Future, session: ClientSession):
+        """Release the objects referenced by the response of a job that will not be collected."""
+        def release_references(value):
+            if isinstance(value, list):
+                for element in value:
+                    release_references(element)
+            elif isinstance(value, dict):
+                if value.get("type") == "RemoteVar":
+                    session.variables.release(str(value["value"]))
+                else:
+                    release_references(value.get("return"))
+
+        if not future.cancelled() and future.exception() is None:
+            release_references(future.result())
+
+    def lock_instrument(self, command_json: Dict[str, Any], session: ClientSession) -> Dict[str, Any]:
+        """Acquire ("lock": true) or release ("lock": false) the exclusive use of the instrument for a session.
+
+        While a session holds the lock, the queued calls of all other sessions wait. The lock is also released when
+        the last connection of the session is closed.
+        """
+        if command_json["lock"]:
+            self.scheduler.acquire(session)
+        else:
+            self.scheduler.release(session)
+        return self.execute_command(command_json, session)
+
+    def serialize_response(self, response: Dict[str, Any], request_id=None, compression: Optional[list] = None,
+                           attachments: Optional[list] = None) -> str:
+        """Serialize and compress a response. With a list of attachments, the data of packed arrays is appended to it
+        instead of being encoded in the JSON, see dumps_json."""
+        start = time.perf_counter()
+        if request_id is not None:
+            response["id"] = request_id
+        try:
+            result = dumps_json(response, attachments)
+        except Exception:
+            # e.g. a result of a builtin type that JSON cannot represent, the response is replaced in place
+            response.clear()
+            response.update(exception_response())
+            if request_id is not None:
+                response["id"] = request_id
+            if attachments is not None:
+                attachments.clear()
+            result = dumps_json(response)
+        if compression and len(result) >= self.compression_threshold:
+            result = self.compress_response(result, compression, request_id)
+        self.metrics.record_response(time.perf_counter() - start, response.get("status") != "success")
+        return result
+
+    def compress_response(self, response: str, compression: list, request_id=None) -> str:
+        """Compress the response with the first of the accepted codecs that is supported by the server."""
+        codec = next((codec for codec in compression if codec in COMPRESSORS), None)
+        if codec is None:
+            return response
+        compressed = self.compress(codec, response.encode("utf-8"))
+        compressed_response = {
+            "compression": codec,
+            "value": base64.b64encode(compressed).decode("ascii")
+        }
+        if request_id is not None:
+            compressed_response["id"] = request_id
+        return dumps_json(compressed_response)
+
+    def compress_frame(self, data: bytes, attachments: list, compression: list, request_id=None) -> Optional[bytes]:
+        """Compress the JSON part and the attachments of a length-prefixed frame together with the first of the
+        accepted codecs that is supported by the server, or return None if there is none.
+
+        The JSON part of the compressed frame names the codec and the "length" of the uncompressed JSON part, the
+        binary part is the compressed data.
+        """
+        codec = next((codec for codec in compression if codec in COMPRESSORS), None)
+        if codec is None:
+            return None
+        compressed = self.compress(codec, b"".join([data, *attachments]))
+        compressed_response = {
+            "compression": codec,
+            "length": len(data)
+        }
+        if request_id is not None:
+            compressed_response["id"] = request_id
+        header = dumps_json(compressed_response).encode("utf-8")
+        return b"".join([FRAME_HEADER.pack(len(header), len(compressed)), header, compressed])
+
+    def compress(self, codec: str, uncompressed: bytes) -> bytes:
+        """Compress data with a codec and count it in the compression statistics."""
+        start = time.perf_counter()
+        compressed = COMPRESSORS[codec](uncompressed)
+        statistics = self.compression_statistics
+        statistics["time"] += time.perf_counter() - start
+        statistics["responses"] += 1
+        statistics["uncompressed_bytes"] += len(uncompressed)
+        statistics["compressed_bytes"] += len(compressed)
+        return compressed
+
+    def execute_command(self, command_json: Dict[str, Any], session: Optional[ClientSession] = None) -> Dict[str, Any]:
+        session = session or self._default_session
+        if "job" in command_json:
+            # the releases of the command are queued by start_job
+            return self.start_job(command_json, session)
+        session.variables.evict()
+        if "release" in command_json:
+            self.release_variables(command_json["release"], session)
+        if "schema" in command_json:
+            return self.get_schema(command_json)
+        if "metrics" in command_json:
+            return {
+                "status": "success",
+                "return": self.get_metrics()
+            }
+        if "job_id" in command_json:
+            return self.query_job(command_json, session)
+        if "class" not in command_json:
+            if any(key in command_json for key in ("function", "attribute", "batch", "namespace")):
+                raise ValueError("The command has no \"class\" that names the served object.")
+            # a command that only releases variables or locks the instrument
+            return {
+                "status": "success",
+                "return": self.convert_argument_to_json(None)
+            }
+        if "batch" in command_json:
+            return self.run_batch(command_json, session)
+        if "namespace" in command_json:
+            return self.get_namespace(command_json)
         if "function" not in command_json:
-            return self.get_attribute(command)
-        target_class = command_json["class"]
-        function = command_json["function"]
+            return self.get_attribute(command_json, session)
+        if "repeat" in command_json:
+            return self.run_repeated(command_json, session)
+        return self.run_function(command_json, session)
+
+    def release_variables(self, names: list, session: Optional[ClientSession] = None):
+        """Delete objects that are no longer referenced by the client. Unknown names are ignored."""
+        session = session or self._default_session
+        for name in names:
+            session.variables.release(str(name))
+
+    def run_function(self, command_json: Dict[str, Any], session: Optional[ClientSession] = None) -> Dict[str, Any]:
+        result = self.call_function(command_json, session)
+        ret = self.convert_argument_to_json(result, command_json.get("packed", False), session)
+        return {
+            "status": "success",
+            "return": ret
+        }
+
+    def release_and_call(self, command_json: Dict[str, Any], session: Optional[ClientSession] = None):
+        """Release the variables named in the command, if not done yet, and call its function like call_function."""
+        session = session or self._default_session
+        session.variables.evict()
+        if "release" in command_json:
+            self.release_variables(command_json.pop("release"), session)
+        return self.call_function(command_json, session)
+
+    def call_function(self, command_json: Dict[str, Any], session: Optional[ClientSession] = None,
+                      results: Optional[list] = None):
+        """Call a function of a served object and return the result without converting it."""
+        target_function, args, kwargs = self.prepare_call(command_json, session, results)
+        return self.timed_call(command_json, target_function, args, kwargs)
+
+    def timed_call(self, command_json: Dict[str, Any], target_function, args, kwargs):
+        """Call the function and record the execution time in the metrics."""
+        name = f"{command_json['class']}.{command_json['function']}"
+        start = time.perf_counter()
+        try:
+            result = target_function(*args, **kwargs)
+        except Exception as e:
+            self.metrics.record_call(name, time.perf_counter() - start, e)
+            raise
+        self.metrics.record_call(name, time.perf_counter() - start)
+        return result
+
+    def prepare_call(self, command_json: Dict[str, Any], session: Optional[ClientSession] = None,
+                     results: Optional[list] = None):
+        """Return the function of a served object and the converted arguments of a call."""
+        target_function = self.return_function(command_json["class"], command_json["function"])
         args_raw = command_json.get("args", [])
-        args = [self.convert_argument_from_json(arg) for arg in args_raw]
+        args = [self.convert_argument_from_json(arg, session, results) for arg in args_raw]
         kwargs_raw = command_json.get("kwargs", {})
-        kwargs = {k: self.convert_argument_from_json(v) for k, v in kwargs_raw.items()}
-        target_function = getattr(self.return_target(target_class), function)
-        result = target_function(*args, **kwargs)
-        ret = self.convert_argument_to_json(result)
-        return json.dumps({
+        kwargs = {k: self.convert_argument_from_json(v, session, results) for k, v in kwargs_raw.items()}
+        return target_function, args, kwargs
+
+    def run_repeated(self, command_json: Dict[str, Any], session: Optional[ClientSession] = None) -> Dict[str, Any]:
+        """Call a function "repeat" times with the same arguments, e.g. for a series of spot measurements.
+
+        The result is the list of the return values and the list of the host times (seconds since the epoch) at which
+        the calls were started. With "interval" (in seconds), the calls are started at this fixed rate, otherwise
+        right after each other. Commands with an interval that reach the server over TCP are executed by
+        repeat_function instead, which does not block the instrument thread between the calls.
+        """
+        count = self.repetitions(command_json)
+        interval = command_json.get("interval")
+        target_function, args, kwargs = self.prepare_call(command_json, session)
+        values = []
+        timestamps = []
+        start = time.perf_counter()
+        # the times are measured with the monotonic clock and converted to the system time once
+        epoch_offset = time.time() - start
+        for index in range(count):
+            if interval:
+                delay = start + index * interval - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            call_start = time.perf_counter()
+            values.append(self.timed_call(command_json, target_function, args, kwargs))
+            timestamps.append(epoch_offset + call_start)
+        ret = self.convert_argument_to_json([values, timestamps], command_json.get("packed", False), session)
+        return {
             "status": "success",
             "return": ret
-        })
+        }
+
+    @staticmethod
+    def repetitions(command_json: Dict[str, Any]) -> int:
+        count = command_json["repeat"]
+        if not isinstance(count, int) or count < 0:
+            raise ValueError(f"The number of repetitions must be a non-negative integer, not {count!r}.")
+        return count
+
+    def run_batch(self, command_json: Dict[str, Any], session: Optional[ClientSession] = None) -> Dict[str, Any]:
+        """Run a list of function calls in order and return the list of their results.
 
-    def get_attribute(self, command: str) -> str:
-        command_json = json.loads(command)
+        Arguments of a call can refer to the result of an earlier call with {"type": "Result", "value": index}, see
+        resolve_result. If "outputs" is given, only the results of the calls with these indices are returned. The
+        other results stay on the server and are discarded after the batch.
+
+        Execution stops at the first exception. The response then contains the index of the failed call and the
+        results of the calls before it.
+        """
+        calls = command_json["batch"]
+        outputs = command_json.get("outputs", range(len(calls)))
+        if not all(0 <= output < len(calls) for output in outputs):
+            raise ValueError("The outputs of a batch must be indices of its calls.")
+        results = []
+
+        def convert_outputs(available: int) -> list:
+            return [self.convert_argument_to_json(results[output], calls[output].get("packed", False), session)
+                    for output in outputs if output < available]
+
+        for index, call in enumerate(calls):
+            call.setdefault("class", command_json["class"])
+            try:
+                results.append(self.call_function(call, session, results))
+            except Exception:
+                response = exception_response()
+                response["index"] = index
+                response["return"] = convert_outputs(index)
+                return response
+        return {
+            "status": "success",
+            "return": convert_outputs(len(calls))
+        }
+
+    def get_attribute(self, command_json: Dict[str, Any], session: Optional[ClientSession] = None) -> Dict[str, Any]:
         target_class = command_json["class"]
         attribute = command_json["attribute"]
+        if attribute.startswith("_"):
+            raise AttributeError(f"{attribute} is private and cannot be accessed by clients.")
         target_attribute = getattr(self.return_target(target_class), attribute)
         if callable(target_attribute):
             ret = {
@@ -77,55 +1430,223 @@ class Server:
                 "value": None
             }
         else:
-            ret = self.convert_argument_to_json(target_attribute)
-        return json.dumps({
+            ret = self.convert_argument_to_json(target_attribute, session=session)
+        return {
             "status": "success",
             "return": ret
-        })
+        }
 
+    def get_namespace(self, command_json: Dict[str, Any]) -> Dict[str, Any]:
+        """Return all public constants (numbers, strings and booleans) of the target in one response."""
+        target_class = command_json["class"]
+        return {
+            "status": "success",
+            "return": self.namespace_of(self.return_target(target_class))
+        }
+
+    def namespace_of(self, target) -> Dict[str, Any]:
+        ret = {}
+        for name in dir(target):
+            if name.startswith("_"):
+                continue
+            value = getattr(target, name)
+            if type(value) in self._namespace_types:
+                ret[name] = self.convert_argument_to_json(value)
+        return ret
+
+    def get_schema(self, command_json: Dict[str, Any]) -> Dict[str, Any]:
+        """Describe the functions and constants of one target, or of all targets if no "class" is given.
+
+        For each function, the parameters with their kind, annotation and default (as repr) are returned, so that
+        clients can create local stubs that check the arguments before sending a call.
+        """
+        if "class" in command_json:
+            target_classes = [command_json["class"]]
+        else:
+            target_classes = list(self._target_classes)
+        ret = {}
+        for target_class in target_classes:
+            if target_class not in self._schemas:
+                self._schemas[target_class] = self.schema_of(self.return_target(target_class))
+            ret[target_class] = self._schemas[target_class]
+        return {
+            "status": "success",
+            "return": ret
+        }
+
+    def schema_of(self, target) -> Dict[str, Any]:
+        functions = {}
+        for name, function in self.functions_of(target).items():
+            try:
+                signature = inspect.signature(function)
+            except (TypeError, ValueError):
+                # e.g. some builtins do not provide a signature, calls to them are not checked by the client
+                parameters = None
+                return_annotation = None
+            else:
+                parameters = [self.parameter_schema(parameter) for parameter in signature.parameters.values()]
+                return_annotation = self.annotation_schema(signature.return_annotation)
+            functions[name] = {
+                "parameters": parameters,
+                "return_annotation": return_annotation,
+                "doc": inspect.getdoc(function),
+            }
+        return {
+            "functions": functions,
+            "constants": self.namespace_of(target),
+        }
+
+    def parameter_schema(self, parameter: inspect.Parameter) -> Dict[str, Any]:
+        ret = {
+            "name": parameter.name,
+            "kind": parameter.kind.name,
+            "annotation": self.annotation_schema(parameter.annotation),
+        }
+        if parameter.default is not inspect.Parameter.empty:
+            ret["default"] = repr(parameter.default)
+        return ret
+
+    @staticmethod
+    def annotation_schema(annotation) -> Optional[str]:
+        if annotation is inspect.Signature.empty:
+            return None
+        if isinstance(annotation, str):
+            # modules using "from __future__ import annotations" keep the annotations as strings
+            return annotation
+        return inspect.formatannotation(annotation)
 
 server: Optional[Server] = None
 
 
+def exception_response() -> Dict[str, Any]:
+    """Build the response for the exception that is currently being handled."""
+    traceback.print_exc()
+    et, ev, tb = sys.exc_info()
+    message = repr(ev)
+    tb = Traceback(tb).to_dict()
+    return {
+        "status": "exception",
+        "message": message,
+        "traceback": tb
+    }
+
+
 async def handle_request(reader, writer):
+    # Clients may keep the connection open and send several newline-delimited commands, also without waiting for the
+    # previous response (pipelining). The next commands are read while the previous ones are executed, each command is
+    # answered in order and the connection is only closed once the client closes its side.
+    sock = writer.get_extra_info("socket")
+    if sock is not None:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    peer = writer.get_extra_info("peername")
+    logging.debug(f"Connection opened by {peer}")
+    server.metrics.connections += 1
 
+    # the responses in the order of the requests, None marks the end of the connection
+    responses: asyncio.Queue = asyncio.Queue(PIPELINE_DEPTH)
+    write_task = asyncio.ensure_future(write_responses(writer, responses, peer))
+    # the client sessions that have been used on this connection
+    connection_sessions = set()
+    framing = "line"
     try:
-        data = await reader.readline()
-        command = data.decode("utf-8")
-        result = server.run_command(command)
-        result = result.encode("utf-8")
-    except Exception as e:
-        traceback.print_exc()
-        et, ev, tb = sys.exc_info()
-        message = repr(ev)
-        tb = Traceback(tb).to_dict()
-        result = json.dumps(
-            {
-                "status": "exception",
-                "message": message,
-                "traceback": tb
-            }
-        ).encode("utf-8")
-    writer.write(result + b'\n')
-    await writer.drain()
+        while True:
+            if framing == "line":
+                data = await reader.readline()
+                if not data:
+                    break
+                # the framing has to be switched before the next message is read
+                if b'"handshake"' in data:
+                    handshake = server.handshake(data)
+                    if handshake is not None:
+                        response, framing = handshake
+                        await responses.put(response)
+                        continue
+            else:
+                try:
+                    header = await reader.readexactly(FRAME_HEADER.size)
+                    json_length, binary_length = FRAME_HEADER.unpack(header)
+                    if binary_length or json_length > MESSAGE_LIMIT:
+                        logging.error(f"Invalid frame from {peer}, closing the connection.")
+                        break
+                    data = await reader.readexactly(json_length)
+                except asyncio.IncompleteReadError:
+                    break
+            await responses.put(asyncio.ensure_future(server.process_command(data, connection_sessions, framing)))
+    except ConnectionError:
+        logging.debug(f"Connection to {peer} lost")
+    finally:
+        await responses.put(None)
+        await write_task
+        server.close_sessions(connection_sessions)
+        server.metrics.connections -= 1
+        logging.debug(f"Connection closed by {peer}")
+        writer.close()
+
 
+async def write_responses(writer, responses: asyncio.Queue, peer):
+    # After the connection was lost, the remaining responses are still awaited so that the queue never blocks the
+    # reading of the requests.
+    connected = True
+    while True:
+        response = await responses.get()
+        if response is None:
+            return
+        if not isinstance(response, bytes):
+            response = await response
+        if isinstance(response, bytes):
+            connected = connected and await write_message(writer, response, peer)
+            continue
+        # a stream, its next message is only produced after the previous one was written
+        try:
+            async for data in response:
+                connected = connected and await write_message(writer, data, peer)
+                if not connected:
+                    break
+        finally:
+            await response.aclose()
+
+
+async def write_message(writer, data: bytes, peer) -> bool:
+    """Write a message and wait until it was sent, return whether the connection is still open."""
+    try:
+        writer.write(data)
+        await writer.drain()
+    except ConnectionError:
+        logging.debug(f"Connection to {peer} lost")
+        return False
+    return True
+
+
+async def handle_metrics_request(reader, writer):
+    # the metrics are sent as plain text right after the connection was opened
+    writer.write(format_metrics(server.get_metrics()).encode("utf-8"))
+    try:
+        await writer.drain()
+    except ConnectionError:
+        pass
     writer.close()
 
 
-async def main(local_ip: str, local_port: int):
+async def main(local_ip: str, local_port: int, metrics_port: Optional[int] = None):
     tcp_server = await asyncio.start_server(
-        handle_request, local_ip, local_port)
+        handle_request, local_ip, local_port, limit=MESSAGE_LIMIT)
 
     addr = tcp_server.sockets[0].getsockname()
     logging.info(f'Serving on {addr}')
 
+    if metrics_port is not None:
+        # only reachable from the computer of the server
+        metrics_server = await asyncio.start_server(handle_metrics_request, "127.0.0.1", metrics_port)
+        logging.info(f'Serving metrics on {metrics_server.sockets[0].getsockname()}')
+
     async with tcp_server:
         await tcp_server.serve_forever()
 
 
-def run_server(local_ip: str, local_port: int, served_objects: Dict[str, Any]):
+def run_server(local_ip: str, local_port: int, served_objects: Dict[str, Any], memory_budget: Optional[int] = None,
+               variable_ttl: Optional[float] = None, metrics_port: Optional[int] = None):
     global server
     if server is not None:
         raise Exception("The server cannot be run more than once.")
-    server = Server(served_objects)
-    asyncio.run(main(local_ip, local_port))
+    server = Server(served_objects, memory_budget, variable_ttl)
+    asyncio.run(main(local_ip, local_port, metrics_port))
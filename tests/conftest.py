@@ -0,0 +1,284 @@
+"""
+Fixtures of the tests of the tcp_server and the clients over TCP on the local computer.
+
+The server is started in a subprocess with "python tests/conftest.py --serve PORT [METRICS_PORT]". It serves the fake
+lpt module of make_test_lpt, whose functions log the order of their calls, so that the scheduling of the server can be
+checked through the protocol.
+"""
+import functools
+import json
+import socket
+import subprocess
+import sys
+import threading
+import time
+import types
+import uuid
+from pathlib import Path
+from typing import Optional, Tuple
+
+import pytest
+
+SRC = Path(__file__).resolve().parents[1] / "src"
+sys.path.insert(0, str(SRC))
+# the server module is imported as top-level module, like by app.py
+sys.path.insert(0, str(SRC / "tcp_server"))
+
+from tcp_client.ProxyClass import Proxy  # noqa: E402
+
+# the manual tests start a server that runs until it is stopped, they are not collected by pytest
+collect_ignore = ["manual"]
+
+# limits of the served test server, small enough to be reached by the tests
+MEMORY_BUDGET = 2 ** 20
+SESSION_TTL = 0.5
+
+
+def make_test_lpt() -> types.ModuleType:
+    lpt = types.ModuleType("lpt")
+    lpt.KI_INTGPLC = 2
+    lpt.PI = 3.14
+    lpt.NAME = "fake"
+    log = []
+    state = {"start": 0.0, "end": 0.0, "closed": 0}
+
+    def intgi(instr_id: int) -> float:
+        return 1.5e-9
+
+    # the waveforms are generated once per length, so that only the transfer is measured
+    @functools.lru_cache(maxsize=8)
+    def waveform(points: int):
+        return [0.5] * points, [1e-6] * points, [1e-8 * i for i in range(points)], [0] * points
+
+    def pulse_fetch(instr_id: int, chan: int, start_index: int, stop_index: int):
+        return waveform(stop_index - start_index + 1)
+
+    def record(name: str) -> str:
+        log.append(name)
+        return name
+
+    def take_log() -> list:
+        entries = log[:]
+        log.clear()
+        return entries
+
+    def slow(seconds: float, name: str = "slow") -> str:
+        log.append(name)
+        time.sleep(seconds)
+        return name
+
+    def slow_abort():
+        # an abort that takes long, so that a race with the next call would show in the log
+        log.append("abort start")
+        time.sleep(0.2)
+        log.append("abort end")
+
+    def add(value: int, step: int = 1) -> int:
+        """Return value + step."""
+        return value + step
+
+    def fail(message: str):
+        raise ValueError(message)
+
+    def thread_id() -> int:
+        return threading.get_ident()
+
+    def make_object():
+        return types.SimpleNamespace()
+
+    def type_name(value) -> str:
+        return type(value).__name__
+
+    def make_buffer(size: int) -> bytearray:
+        return bytearray(size)
+
+    def floats(count: int) -> list:
+        return [i * 0.001 for i in range(count)]
+
+    def generate(count: int):
+        try:
+            for i in range(count):
+                yield [i] * 20
+        finally:
+            state["closed"] += 1
+
+    def closed_generators() -> int:
+        return state["closed"]
+
+    def pulse_exec(seconds: float):
+        state["start"] = time.monotonic()
+        state["end"] = state["start"] + seconds
+
+    def pulse_exec_status():
+        # 1 is PMU_TEST_STATUS_RUNNING
+        now = time.monotonic()
+        return int(now < state["end"]), now - state["start"]
+
+    def pulse_exec_wait():
+        while time.monotonic() < state["end"]:
+            time.sleep(0.001)
+        return make_object()
+
+    def dev_abort():
+        log.append("dev_abort")
+        state["end"] = 0.0
+
+    def _private():
+        return "private"
+
+    for function in (intgi, pulse_fetch, record, take_log, slow, slow_abort, add, fail, thread_id, make_object,
+                     type_name, make_buffer, floats, generate, closed_generators, pulse_exec, pulse_exec_status,
+                     pulse_exec_wait, dev_abort, _private):
+        setattr(lpt, function.__name__, function)
+    return lpt
+
+
+def serve(port: int, metrics_port: Optional[int] = None):
+    import server as server_module
+    server_module.Server.session_ttl = SESSION_TTL
+    server_module.run_server("127.0.0.1", port, {"lpt": make_test_lpt()}, MEMORY_BUDGET, metrics_port=metrics_port)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port: int, process: Optional[subprocess.Popen] = None):
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            if (process is not None and process.poll() is not None) or time.monotonic() > deadline:
+                raise RuntimeError(f"Nothing accepts connections on port {port}.")
+            time.sleep(0.05)
+
+
+def start_server(metrics_port: Optional[int] = None) -> Tuple[subprocess.Popen, int]:
+    """Start the test server in a subprocess on a free port and wait until it accepts connections."""
+    port = free_port()
+    arguments = [sys.executable, __file__, "--serve", str(port)]
+    if metrics_port is not None:
+        arguments.append(str(metrics_port))
+    process = subprocess.Popen(arguments, stdout=subprocess.DEVNULL)
+    try:
+        wait_for_port(port, process)
+        if metrics_port is not None:
+            wait_for_port(metrics_port, process)
+    except RuntimeError:
+        process.kill()
+        raise
+    return process, port
+
+
+@pytest.fixture(scope="module")
+def port():
+    """Port of a test server that is shared by the tests of a module."""
+    process, port = start_server()
+    yield port
+    process.terminate()
+    process.wait()
+
+
+@pytest.fixture
+def make_proxy(port):
+    """Return a function that creates proxies of the lpt module of the test server.
+
+    Each proxy has a session of its own, so that the tests do not share objects or the instrument lock.
+    """
+    def make_proxy(**options) -> Proxy:
+        proxy = Proxy("127.0.0.1", options.pop("port", port), "lpt", **options)
+        proxy.session = uuid.uuid4().hex
+        return proxy
+
+    return make_proxy
+
+
+def remote_vars(proxy: Proxy) -> int:
+    return proxy.server_metrics()["remote_vars"]["count"]
+
+
+def send_command(port: int, command: dict) -> dict:
+    """Send a single command as line to the server and return its response, without the checks of the clients."""
+    with socket.create_connection(("127.0.0.1", port)) as sock:
+        sock.sendall(json.dumps(command).encode("utf-8") + b"\n")
+        with sock.makefile("rb") as file:
+            return json.loads(file.readline())
+
+
+class Relay:
+    """
+    Forwards the connections to a local port, so that the tests can cut them like a broken network link would.
+    """
+
+    def __init__(self, target_port: int):
+        self.target_port = target_port
+        self._listener = socket.socket()
+        self._listener.bind(("127.0.0.1", 0))
+        self._listener.listen()
+        self.port = self._listener.getsockname()[1]
+        self._sockets = []
+        self._lock = threading.Lock()
+        # number of accepted connections
+        self.connections = 0
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                client, _ = self._listener.accept()
+            except OSError:
+                return
+            target = socket.create_connection(("127.0.0.1", self.target_port))
+            with self._lock:
+                self._sockets += [client, target]
+                self.connections += 1
+            threading.Thread(target=self._forward, args=(client, target), daemon=True).start()
+            threading.Thread(target=self._forward, args=(target, client), daemon=True).start()
+
+    @staticmethod
+    def _forward(source: socket.socket, destination: socket.socket):
+        try:
+            while True:
+                data = source.recv(65536)
+                if not data:
+                    break
+                destination.sendall(data)
+            destination.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+
+    def cut(self):
+        """Close all forwarded connections in both directions."""
+        with self._lock:
+            sockets, self._sockets = self._sockets, []
+        for sock in sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+
+    def close(self):
+        try:
+            # wakes up the accepting thread
+            self._listener.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._listener.close()
+        self.cut()
+
+
+@pytest.fixture
+def relay(port):
+    relay = Relay(port)
+    yield relay
+    relay.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) in (3, 4) and sys.argv[1] == "--serve":
+        serve(int(sys.argv[2]), int(sys.argv[3]) if len(sys.argv) == 4 else None)
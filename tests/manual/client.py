@@ -1,5 +1,5 @@
 import logging, sys
-from tcp_client.ProxyClass import Proxy
+from tcp_client.ProxyClass import Proxy, deadline
 
 logging.basicConfig(stream=sys.stdout)
 # remove for production use:
@@ -24,4 +24,24 @@ print(t.get_co(gate))
 print(t.get_co(source))
 print(t.get_co(drain))
 
+# pipelined calls, answered in the order they were submitted
+pending = [t.submit("get_double", i) for i in range(10)]
+print([call.result() for call in pending])
+
+# a sequence of calls without calls of other clients in between
+with t.instrument_lock():
+    print(t.get_double(3), t.get_double(4))
+
+# a background job, collected later
+job = t.start_job("get_double", 21)
+print(job.status(), job.result(timeout=5))
+
+# a long result in chunks
+for chunk in t.stream("get_range", 100, chunk_size=30):
+    print(len(chunk), chunk[0])
+
+# calls that are not started within a second are dropped by the server
+with deadline(1):
+    print(t.get_double(5))
+
 print("x")
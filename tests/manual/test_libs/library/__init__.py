@@ -26,3 +26,7 @@ def do_something(action):
 
 def get_double(number):
     return number * 2
+
+
+def get_range(count):
+    return list(range(count))
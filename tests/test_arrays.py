@@ -0,0 +1,49 @@
+"""
+Tests of the packed binary arrays for long lists of numbers.
+"""
+import base64
+
+import pytest
+
+from conftest import send_command
+
+
+def test_long_lists_are_packed(port):
+    command = {"class": "lpt", "function": "floats", "args": [{"type": "int", "value": 100}], "packed": True}
+    packed = send_command(port, command)["return"]
+    assert packed["type"] == "array"
+    assert packed["typecode"] == "d"
+    assert len(base64.b64decode(packed["value"])) == 800
+    # without "packed", e.g. from older clients, the list is sent element by element
+    del command["packed"]
+    assert len(send_command(port, command)["return"]) == 100
+
+
+def test_packed_arrays_are_lists_by_default(make_proxy):
+    proxy = make_proxy()
+    assert type(proxy.repeat("add", 20, 1)[0]) is list
+    assert type(proxy.repeat("add", 10, 1)[0]) is list
+    assert all(type(column) is list for column in proxy.pulse_fetch(1, 1, 0, 99))
+    proxy.array_format = "array"
+    assert proxy.floats(100).typecode == "d"
+    assert proxy.floats(100).tolist() == [i * 0.001 for i in range(100)]
+    # too short to be packed
+    assert type(proxy.floats(10)) is list
+
+
+@pytest.mark.parametrize("framing", ["line", "length"])
+def test_packed_arrays_with_framing(make_proxy, framing):
+    proxy = make_proxy(framing=framing)
+    v, i, t, status = proxy.pulse_fetch(1, 1, 0, 999)
+    assert v == [0.5] * 1000
+    assert t == [1e-8 * i for i in range(1000)]
+    assert status == [0] * 1000
+
+
+def test_numpy_arrays(make_proxy):
+    numpy = pytest.importorskip("numpy")
+    proxy = make_proxy()
+    proxy.array_format = "numpy"
+    values = proxy.floats(100)
+    assert isinstance(values, numpy.ndarray)
+    assert values.tolist() == [i * 0.001 for i in range(100)]
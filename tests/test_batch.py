@@ -0,0 +1,46 @@
+"""
+Tests of batches of calls sent in one message.
+"""
+import pytest
+
+from tcp_client.ProxyClass import BatchException, RemoteException
+
+
+def test_batch_returns_the_results_in_order(make_proxy):
+    proxy = make_proxy()
+    with proxy.batch() as batch:
+        assert batch.add(1) == 0
+        assert batch.add(2, step=10) == 1
+        batch.record("third")
+    assert batch.results == [2, 12, "third"]
+
+
+def test_failed_call_stops_the_batch(make_proxy):
+    proxy = make_proxy()
+    proxy.take_log()
+    with pytest.raises(BatchException, match="Call 1 \\(fail\\)") as info:
+        with proxy.batch() as batch:
+            batch.record("before")
+            batch.fail("broken")
+            batch.record("after")
+    assert isinstance(info.value, RemoteException)
+    assert info.value.index == 1
+    assert info.value.results == ["before"]
+    assert proxy.take_log() == ["before"]
+
+
+def test_batch_is_not_sent_after_an_exception_in_the_block(make_proxy):
+    proxy = make_proxy()
+    proxy.take_log()
+    with pytest.raises(KeyError):
+        with proxy.batch() as batch:
+            batch.record("never")
+            raise KeyError("local")
+    assert proxy.take_log() == []
+
+
+def test_empty_batch(make_proxy):
+    proxy = make_proxy()
+    with proxy.batch() as batch:
+        pass
+    assert batch.results == []
@@ -0,0 +1,45 @@
+"""
+Tests of the call statistics of the Proxy.
+"""
+import pytest
+
+from tcp_client.ProxyClass import LatencyHistogram, RemoteException
+
+
+def test_calls_are_counted_per_function(make_proxy):
+    proxy = make_proxy(statistics=True)
+    for i in range(5):
+        proxy.add(i)
+    with pytest.raises(RemoteException):
+        proxy.fail("counted")
+    statistics = proxy.call_statistics.snapshot()
+    assert statistics["add"]["calls"] == 5
+    assert statistics["add"]["failures"] == 0
+    assert statistics["fail"]["failures"] == 1
+    assert statistics["add"]["request_bytes"] > 0
+    assert statistics["add"]["response_bytes"] > 0
+    for phase in ("serialize", "network", "deserialize"):
+        assert statistics["add"][phase]["count"] == 5
+        assert statistics["add"][phase]["min"] <= statistics["add"][phase]["mean"] <= statistics["add"][phase]["max"]
+
+
+def test_statistics_can_be_enabled_later(make_proxy):
+    proxy = make_proxy()
+    assert proxy.call_statistics is None
+    proxy.add(1)
+    proxy.enable_statistics()
+    proxy.add(1)
+    assert proxy.call_statistics.snapshot()["add"]["calls"] == 1
+    proxy.enable_statistics(False)
+    assert proxy.call_statistics is None
+
+
+def test_latency_histogram_buckets():
+    histogram = LatencyHistogram()
+    for duration in (5e-6, 1e-5, 0.003, 20.0):
+        histogram.add(duration)
+    snapshot = histogram.snapshot()
+    assert snapshot["histogram"] == {"<=1e-05": 2, "<=0.005": 1, ">10": 1}
+    assert snapshot["count"] == 4
+    assert snapshot["min"] == 5e-6
+    assert snapshot["max"] == 20.0
@@ -0,0 +1,84 @@
+"""
+Tests of the persistent connections of the clients.
+"""
+import asyncio
+import json
+import socketserver
+import threading
+import time
+
+import pytest
+
+from tcp_client.AsyncProxyClass import AsyncProxy
+from tcp_client.ProxyClass import Proxy
+
+
+class OneShotHandler(socketserver.StreamRequestHandler):
+    """Answers like the servers without support for the handshake: one command per connection, which is closed after
+    the response. Only the function add is served."""
+
+    def handle(self):
+        command = json.loads(self.rfile.readline())
+        if "function" in command and "class" in command:
+            response = {"status": "success", "return": {"type": "int", "value": command["args"][0]["value"] + 1}}
+        elif "attribute" in command and "class" in command:
+            response = {"status": "success", "return": {"type": "callable", "value": None}}
+        else:
+            response = {"status": "exception", "message": "KeyError('class')", "traceback": None}
+        self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+
+
+@pytest.fixture(scope="module")
+def one_shot_port():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), OneShotHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+def test_connection_is_reused(make_proxy, relay):
+    proxy = make_proxy(port=relay.port)
+    assert [proxy.add(i) for i in range(20)] == [i + 1 for i in range(20)]
+    assert relay.connections == 1
+
+
+def test_closed_connection_is_reopened(make_proxy, relay):
+    proxy = make_proxy(port=relay.port)
+    assert proxy.add(1) == 2
+    relay.cut()
+    time.sleep(0.05)
+    assert proxy.add(2) == 3
+    assert relay.connections == 2
+
+
+def test_call_is_not_repeated_after_connection_loss(make_proxy, relay):
+    proxy = make_proxy(port=relay.port)
+    proxy.take_log()
+    thread = threading.Thread(target=lambda: (time.sleep(0.1), relay.cut()))
+    thread.start()
+    with pytest.raises((ConnectionError, OSError)):
+        proxy.slow(0.2, "once")
+    thread.join()
+    time.sleep(0.2)
+    assert proxy.take_log() == ["once"]
+
+
+@pytest.mark.parametrize("framing", ["line", "length"])
+def test_server_without_handshake_gets_a_connection_per_call(one_shot_port, framing):
+    proxy = Proxy("127.0.0.1", one_shot_port, "lpt", framing=framing)
+    assert [proxy.add(i) for i in range(300)] == [i + 1 for i in range(300)]
+    pending = [proxy.submit("add", i) for i in range(20)]
+    assert [call.result() for call in pending] == [i + 1 for i in range(20)]
+
+
+def test_async_proxy_with_server_without_handshake(one_shot_port):
+    async def run():
+        proxy = AsyncProxy("127.0.0.1", one_shot_port, "lpt", framing="length")
+        results = await asyncio.gather(*[proxy.add(i) for i in range(100)])
+        results += [await proxy.add(i) for i in range(100)]
+        await proxy.close()
+        return results
+
+    assert asyncio.run(run()) == [i + 1 for i in range(100)] * 2
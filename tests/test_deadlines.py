@@ -0,0 +1,87 @@
+"""
+Tests of the deadlines of requests, with the test server of conftest.
+"""
+import gc
+import threading
+import time
+
+import pytest
+
+from conftest import remote_vars
+from tcp_client.ProxyClass import RemoteException, ThreadLocalVar, apply_deadline, deadline
+
+
+def test_nested_deadlines_only_shorten_the_time():
+    command_json = {}
+    apply_deadline(command_json)
+    assert command_json == {}
+    with deadline(0.5, abort="dev_abort"):
+        with deadline(10):
+            apply_deadline(command_json)
+    assert 0 < command_json["deadline"] <= 0.5
+    assert command_json["abort"] == "dev_abort"
+
+
+def test_thread_local_var_has_a_value_per_thread():
+    variable = ThreadLocalVar("DEADLINE", default=None)
+    token = variable.set((1.0, "dev_abort"))
+    values = []
+    thread = threading.Thread(target=lambda: values.append(variable.get()))
+    thread.start()
+    thread.join()
+    assert values == [None]
+    assert variable.get() == (1.0, "dev_abort")
+    variable.reset(token)
+    assert variable.get() is None
+
+
+def test_dropped_call_still_releases_variables(make_proxy):
+    proxy = make_proxy()
+    blocker = make_proxy()
+    before = remote_vars(proxy)
+    objects = [proxy.make_object() for _ in range(5)]
+    assert remote_vars(proxy) == before + 5
+    del objects
+    gc.collect()
+    thread = threading.Thread(target=blocker.slow, args=(0.3,))
+    thread.start()
+    time.sleep(0.05)
+    with deadline(0.05):
+        with pytest.raises(RemoteException, match="dropped"):
+            proxy.add(1)
+    thread.join()
+    # queued after the releases
+    assert proxy.add(1) == 2
+    assert remote_vars(proxy) == before
+
+
+def test_abort_at_deadline_ends_before_next_call(make_proxy):
+    proxy = make_proxy()
+    other = make_proxy()
+    proxy.take_log()
+    thread = threading.Thread(target=lambda: (time.sleep(0.05), other.record("next call")))
+    thread.start()
+    # the call ends while the abort is still running
+    with deadline(0.1, abort="slow_abort"):
+        proxy.slow(0.15)
+    thread.join()
+    assert proxy.take_log() == ["slow", "abort start", "abort end", "next call"]
+    # the abort of a call that has ended in time is not done
+    with deadline(0.2, abort="slow_abort"):
+        proxy.slow(0.01)
+    time.sleep(0.3)
+    assert proxy.take_log() == ["slow"]
+
+
+def test_deadline_applies_to_jobs(make_proxy):
+    proxy = make_proxy()
+    blocker = make_proxy()
+    thread = threading.Thread(target=blocker.slow, args=(0.2,))
+    thread.start()
+    time.sleep(0.05)
+    with deadline(0.05):
+        job = proxy.start_job("add", 1)
+    thread.join()
+    assert job.status() == "failed"
+    with pytest.raises(RemoteException, match="dropped"):
+        job.result()
@@ -0,0 +1,64 @@
+"""
+Tests of the dispatch of commands by Server.run_command, without the network.
+"""
+import json
+
+import pytest
+
+import server as server_module
+from conftest import make_test_lpt
+
+
+def value(arg) -> dict:
+    return {"type": type(arg).__name__, "value": arg}
+
+
+@pytest.fixture(params=["orjson", "json"])
+def server(request, monkeypatch):
+    """A server with the fake lpt module, once with orjson, if it is installed, and once with the json module."""
+    if request.param == "orjson" and not server_module.orjson_imported:
+        pytest.skip("orjson is not installed")
+    if request.param == "json":
+        monkeypatch.setattr(server_module, "orjson_imported", False)
+    return server_module.Server({"lpt": make_test_lpt()})
+
+
+def run(server, command: dict) -> dict:
+    return json.loads(server.run_command(json.dumps(command)))
+
+
+def test_function_call(server):
+    response = run(server, {"class": "lpt", "function": "add", "args": [value(1)], "kwargs": {"step": value(2)},
+                            "id": 7})
+    assert response == {"status": "success", "return": value(3), "id": 7}
+
+
+def test_attribute_and_function_lookup(server):
+    assert run(server, {"class": "lpt", "attribute": "KI_INTGPLC"})["return"] == value(2)
+    assert run(server, {"class": "lpt", "attribute": "add"})["return"] == {"type": "callable", "value": None}
+
+
+def test_values_that_orjson_cannot_handle(server):
+    # NaN is written by the json module of the clients, integers beyond 64 bit are not supported by orjson
+    command = '{"class": "lpt", "function": "add", "args": [{"type": "float", "value": NaN}]}'
+    assert json.loads(server.run_command(command))["return"] == {"type": "float", "value": "nan"}
+    response = run(server, {"class": "lpt", "function": "add", "args": [value(2 ** 70)]})
+    assert response["return"] == value(2 ** 70 + 1)
+
+
+@pytest.mark.parametrize("function", ["_private", "KI_INTGPLC", "missing", "__class__"])
+def test_only_public_functions_can_be_called(server, function):
+    response = run(server, {"class": "lpt", "function": function})
+    assert response["status"] == "exception"
+    assert "no public function" in response["message"]
+
+
+def test_unknown_served_object(server):
+    response = run(server, {"class": "os", "function": "getcwd"})
+    assert response["status"] == "exception"
+    assert "no served object" in response["message"]
+
+
+def test_arguments_of_unknown_types_are_rejected(server):
+    response = run(server, {"class": "lpt", "function": "type_name", "args": [{"type": "eval", "value": "1"}]})
+    assert response["status"] == "exception"
@@ -0,0 +1,97 @@
+"""
+Tests of the eviction of the objects kept by the server and of the measurement cache of pylptlib.
+"""
+import ctypes
+import time
+
+import pytest
+
+from pylptlib import lpt
+from server import MemoryBudget, VariableStore
+
+
+def test_least_recently_used_object_is_evicted():
+    store = VariableStore(3 * 500)
+    first, second, third = (store.add(bytearray(400)) for _ in range(3))
+    store.get(first)
+    store.add(bytearray(400))
+    assert store.get(first) is not None
+    with pytest.raises(KeyError, match="memory budget"):
+        store.get(second)
+    assert store.get(third) is not None
+
+
+def test_stores_share_a_memory_budget():
+    budget = MemoryBudget(3 * 500)
+    stores = [VariableStore(budget) for _ in range(2)]
+    oldest = stores[0].add(bytearray(400))
+    for _ in range(3):
+        stores[1].add(bytearray(400))
+    assert budget.memory == stores[0].memory + stores[1].memory <= budget.limit
+    with pytest.raises(KeyError, match="evicted"):
+        stores[0].get(oldest)
+
+
+def test_unused_object_is_evicted_after_ttl():
+    store = VariableStore(ttl=0.05)
+    name = store.add(object())
+    time.sleep(0.1)
+    store.evict()
+    with pytest.raises(KeyError, match="not used for more than"):
+        store.get(name)
+
+
+def test_number_of_evicted_names_is_limited():
+    store = VariableStore(1)
+    store.evicted_names_limit = 2
+    names = [store.add(bytearray(100)) for _ in range(5)]
+    with pytest.raises(KeyError, match="evicted"):
+        store.get(names[2])
+    with pytest.raises(KeyError, match="unknown"):
+        store.get(names[0])
+
+
+@pytest.fixture
+def measurements(monkeypatch):
+    """The measurement cache of lpt with a fake measurement function that returns a ctypes array of doubles."""
+    monkeypatch.setattr(lpt, "clrscn", lambda: None, raising=False)
+    monkeypatch.setattr(lpt, "fake_sweep", lambda points: (ctypes.c_double * points)(*range(points)), raising=False)
+    lpt.reset_measurement_cache()
+    yield lpt
+    lpt.set_measurement_cache_limits()
+    lpt.reset_measurement_cache()
+
+
+def test_measurement_cache_evicts_least_recently_used(measurements):
+    measurements.set_measurement_cache_limits(max_bytes=2 * 800)
+    for key in ("first", "second"):
+        measurements.prepare_measurement("fake_sweep", key, 100)
+    measurements.read_measurement("first")
+    measurements.prepare_measurement("fake_sweep", "third", 100)
+    assert measurements.measurement_cache_size() == 2 * 800
+    assert measurements.read_measurement("first") == [float(i) for i in range(100)]
+    with pytest.raises(KeyError, match="cache limit"):
+        measurements.read_measurement("second")
+
+
+def test_measurement_cache_ttl(measurements):
+    measurements.prepare_measurement("fake_sweep", "old", 10)
+    measurements.set_measurement_cache_limits(ttl=0.05)
+    time.sleep(0.1)
+    with pytest.raises(KeyError, match="not used for more than"):
+        measurements.read_measurement("old")
+    # a prepared measurement with the same key is available again
+    measurements.prepare_measurement("fake_sweep", "old", 10)
+    assert len(measurements.read_measurement("old")) == 10
+
+
+def test_number_of_evicted_measurements_is_limited(measurements):
+    measurements.set_measurement_cache_limits(max_bytes=80)
+    # only the keys of the last 10000 evicted measurements are remembered
+    for index in range(10002):
+        measurements.prepare_measurement("fake_sweep", str(index), 10)
+    with pytest.raises(KeyError, match="evicted"):
+        measurements.read_measurement("1")
+    with pytest.raises(KeyError) as info:
+        measurements.read_measurement("0")
+    assert "evicted" not in str(info.value)
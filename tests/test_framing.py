@@ -0,0 +1,99 @@
+"""
+Tests of the length-prefixed framing and of the handshake that switches a connection to it.
+"""
+import asyncio
+import json
+import socket
+import socketserver
+import threading
+
+import pytest
+
+from tcp_client.AsyncProxyClass import AsyncProxy
+from tcp_client.ProxyClass import FRAME_HEADER, PROTOCOL_VERSION, Proxy, RemoteException
+
+
+def handshake(sock: socket.socket, version, framing: str = "length") -> dict:
+    sock.sendall(json.dumps({"handshake": {"version": version, "framing": framing}}).encode("utf-8") + b"\n")
+    with sock.makefile("rb") as file:
+        return json.loads(file.readline())
+
+
+def test_handshake_switches_to_length_prefixed_frames(port):
+    with socket.create_connection(("127.0.0.1", port)) as sock:
+        response = handshake(sock, PROTOCOL_VERSION)
+        assert response["return"] == {"version": PROTOCOL_VERSION, "framing": "length"}
+        command = json.dumps({"class": "lpt", "function": "add", "args": [{"type": "int", "value": 1}]}).encode()
+        sock.sendall(FRAME_HEADER.pack(len(command), 0) + command)
+        with sock.makefile("rb") as file:
+            json_length, binary_length = FRAME_HEADER.unpack(file.read(FRAME_HEADER.size))
+            assert binary_length == 0
+            assert json.loads(file.read(json_length))["return"] == {"type": "int", "value": 2}
+
+
+@pytest.mark.parametrize("version", [1, PROTOCOL_VERSION + 1, None, "2"])
+def test_server_rejects_unsupported_versions(port, version):
+    with socket.create_connection(("127.0.0.1", port)) as sock:
+        response = handshake(sock, version)
+    assert response["status"] == "exception"
+    assert "Protocol version" in response["message"]
+    # tells the client that the server knows the handshake
+    assert response["version"] == PROTOCOL_VERSION
+
+
+def test_server_rejects_unknown_framing(port):
+    with socket.create_connection(("127.0.0.1", port)) as sock:
+        response = handshake(sock, PROTOCOL_VERSION, "xml")
+    assert response["status"] == "exception"
+    assert "Framing" in response["message"]
+
+
+class NewerServerHandler(socketserver.StreamRequestHandler):
+    """Answers the handshake like a server of a newer protocol version."""
+
+    def handle(self):
+        self.rfile.readline()
+        response = {"status": "success", "return": {"version": PROTOCOL_VERSION + 1, "framing": "length"}}
+        self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+
+
+def test_client_rejects_unsupported_server_version():
+    server = socketserver.TCPServer(("127.0.0.1", 0), NewerServerHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        proxy = Proxy("127.0.0.1", server.server_address[1], "lpt", framing="length")
+        with pytest.raises(RuntimeError, match="protocol version"):
+            proxy.add(1)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.mark.parametrize("framing", ["line", "length"])
+def test_calls_with_framing(make_proxy, framing):
+    proxy = make_proxy(framing=framing)
+    assert proxy.add(1) == 2
+    assert proxy.floats(1000) == [i * 0.001 for i in range(1000)]
+    with pytest.raises(RemoteException, match="broken"):
+        proxy.fail("broken")
+
+
+def test_async_proxy_with_length_framing(port):
+    async def run():
+        proxy = AsyncProxy("127.0.0.1", port, "lpt", framing="length")
+        try:
+            return await proxy.floats(1000)
+        finally:
+            await proxy.close()
+
+    assert asyncio.run(run()) == [i * 0.001 for i in range(1000)]
+
+
+@pytest.mark.parametrize("framing", ["line", "length"])
+def test_compressed_responses(make_proxy, framing):
+    proxy = make_proxy(framing=framing, compression="zlib")
+    assert proxy.floats(100000) == [i * 0.001 for i in range(100000)]
+    statistics = proxy.compression_statistics.snapshot()
+    # the raw doubles alone would be 800 kB
+    assert statistics["compressed_bytes"] < 500000
+    assert statistics["ratio"] > 1
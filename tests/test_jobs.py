@@ -0,0 +1,89 @@
+"""
+Tests of the jobs that the server runs in the background, with the test server of conftest.
+"""
+import asyncio
+import gc
+import time
+
+import pytest
+
+from conftest import remote_vars
+from tcp_client.AsyncProxyClass import AsyncProxy
+from tcp_client.ProxyClass import RemoteException
+
+
+def test_job_collect_and_cancel(make_proxy):
+    proxy = make_proxy()
+    jobs = [proxy.start_job("add", i) for i in range(3)]
+    assert [job.result(timeout=5) for job in jobs] == [1, 2, 3]
+    assert jobs[0].status() == "collected"
+
+    running = proxy.start_job("slow", 0.3)
+    queued = proxy.start_job("add", 1)
+    assert queued.cancel()
+    assert queued.status() == "cancelled"
+    assert running.result(timeout=5) == "slow"
+
+
+def test_running_job_is_aborted_on_cancel(make_proxy):
+    proxy = make_proxy()
+    before = remote_vars(proxy)
+    proxy.pulse_exec(10)
+    job = proxy.start_job("pulse_exec_wait")
+    time.sleep(0.1)
+    assert job.status() == "running"
+    assert not job.cancel()
+    start = time.perf_counter()
+    assert job.cancel(abort="dev_abort")
+    assert job.status() == "cancelled"
+    assert proxy.add(1) == 2
+    assert time.perf_counter() - start < 1
+    # the object returned by the aborted job is released
+    assert remote_vars(proxy) == before
+
+
+def test_cancelled_job_still_releases_variables(make_proxy):
+    proxy = make_proxy()
+    before = remote_vars(proxy)
+    objects = [proxy.make_object() for _ in range(3)]
+    blocker = proxy.start_job("slow", 0.2)
+    del objects
+    gc.collect()
+    job = proxy.start_job("add", 1)
+    assert job.cancel()
+    blocker.result(timeout=5)
+    # queued after the releases
+    assert proxy.add(1) == 2
+    assert remote_vars(proxy) == before
+
+
+def test_async_job_cancel_with_abort(port):
+    async def run():
+        proxy = AsyncProxy("127.0.0.1", port, "lpt")
+        await proxy.pulse_exec(10)
+        job = await proxy.start_job("pulse_exec_wait")
+        await asyncio.sleep(0.05)
+        cancelled = await job.cancel(abort="dev_abort")
+        await proxy.close()
+        return cancelled
+
+    assert asyncio.run(run())
+
+
+def test_failed_job_raises_on_result(make_proxy):
+    proxy = make_proxy()
+    job = proxy.start_job("fail", "broken")
+    while not job.done():
+        time.sleep(0.01)
+    assert job.status() == "failed"
+    with pytest.raises(RemoteException, match="broken"):
+        job.result()
+
+
+def test_job_result_timeout_keeps_job_running(make_proxy):
+    proxy = make_proxy()
+    job = proxy.start_job("slow", 0.3)
+    with pytest.raises(TimeoutError):
+        job.result(timeout=0.05)
+    assert job.status() == "running"
+    assert job.result(timeout=5) == "slow"
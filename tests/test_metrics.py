@@ -0,0 +1,57 @@
+"""
+Tests of the metrics of the server, also on the plain text metrics port.
+"""
+import socket
+
+import pytest
+
+from conftest import free_port, start_server
+from tcp_client.ProxyClass import RemoteException
+
+
+@pytest.fixture(scope="module")
+def ports():
+    metrics_port = free_port()
+    process, port = start_server(metrics_port)
+    yield port, metrics_port
+    process.terminate()
+    process.wait()
+
+
+@pytest.fixture(scope="module")
+def port(ports):
+    return ports[0]
+
+
+def read_metrics(metrics_port: int) -> dict:
+    with socket.create_connection(("127.0.0.1", metrics_port)) as sock:
+        with sock.makefile("r") as file:
+            lines = file.read().splitlines()
+    return dict(line.split(" ", 1) for line in lines)
+
+
+def test_calls_and_exceptions_are_counted(make_proxy):
+    proxy = make_proxy()
+    proxy.add(0)
+    calls = proxy.server_metrics()["functions"]["lpt.add"]["calls"]
+    for i in range(3):
+        proxy.add(i)
+    with pytest.raises(RemoteException):
+        proxy.fail("counted")
+    metrics = proxy.server_metrics()
+    assert metrics["functions"]["lpt.add"]["calls"] == calls + 3
+    assert metrics["functions"]["lpt.add"]["exceptions"] == 0
+    assert metrics["functions"]["lpt.fail"]["exceptions"] >= 1
+    assert metrics["exceptions"]["ValueError"] >= 1
+    assert metrics["functions"]["lpt.add"]["p50"] <= metrics["functions"]["lpt.add"]["max"]
+    assert metrics["connections"] >= 1
+
+
+def test_metrics_port_answers_with_plain_text(make_proxy, ports):
+    proxy = make_proxy()
+    proxy.add(1)
+    metrics = read_metrics(ports[1])
+    assert int(metrics["functions.lpt.add.calls"]) >= 1
+    assert int(metrics["queue_length"]) == 0
+    assert "remote_vars.memory" in metrics
+    assert float(metrics["uptime"]) > 0
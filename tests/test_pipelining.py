@@ -0,0 +1,37 @@
+"""
+Tests of several requests in flight on one connection.
+"""
+import asyncio
+
+from conftest import send_command
+from tcp_client.AsyncProxyClass import AsyncProxy
+
+
+def test_response_carries_the_request_id(port):
+    response = send_command(port, {"class": "lpt", "function": "add", "args": [{"type": "int", "value": 1}],
+                                   "id": 42})
+    assert response["id"] == 42
+    assert response["return"] == {"type": "int", "value": 2}
+
+
+def test_pipelined_calls_are_answered_in_order(make_proxy):
+    proxy = make_proxy()
+    pending = [proxy.submit("slow", 0.01, "first")] + [proxy.submit("add", i) for i in range(100)]
+    assert [call.result() for call in pending] == ["first"] + [i + 1 for i in range(100)]
+    assert proxy.add(1) == 2
+
+
+def test_results_can_be_collected_in_any_order(make_proxy):
+    proxy = make_proxy()
+    pending = [proxy.submit("add", i) for i in range(10)]
+    assert [call.result() for call in reversed(pending)] == [i + 1 for i in reversed(range(10))]
+
+
+def test_concurrent_calls_of_an_async_proxy(port):
+    async def run():
+        proxy = AsyncProxy("127.0.0.1", port, "lpt")
+        results = await asyncio.gather(*[proxy.add(i) for i in range(100)])
+        await proxy.close()
+        return results
+
+    assert asyncio.run(run()) == [i + 1 for i in range(100)]
@@ -0,0 +1,68 @@
+"""
+Tests of programs whose calls use the results of earlier calls.
+"""
+import pytest
+
+from tcp_client.ProxyClass import BatchException
+
+
+def test_results_are_used_as_arguments(make_proxy):
+    proxy = make_proxy()
+    with proxy.program() as program:
+        first = program.add(1)
+        program.add(first, step=10)
+        program.add(first - 1)
+        program.add(first + 0.5)
+    assert program.results == [2, 12, 2, 3.5]
+
+
+def test_elements_of_results(make_proxy):
+    proxy = make_proxy()
+    with proxy.program() as program:
+        data = program.pulse_fetch(1, 1, 0, 9)
+        status = program.add(data[3][9], step=5)
+        kind = program.type_name(data[0])
+        program.returns(status, kind)
+    assert program.results == [5, "list"]
+
+
+def test_selected_results_are_returned(make_proxy):
+    proxy = make_proxy()
+    with proxy.program() as program:
+        first = program.add(1)
+        program.pulse_fetch(1, 1, 0, 99999)
+        last = program.add(first, step=-2)
+        program.returns(last, first)
+    assert program.results == [0, 2]
+
+
+def test_references_are_checked_locally(make_proxy):
+    proxy = make_proxy()
+    program = proxy.program()
+    reference = program.add(1)
+    with pytest.raises(TypeError):
+        (reference + 1)[0]
+    with pytest.raises(TypeError):
+        reference + "text"
+    with pytest.raises(ValueError):
+        program.returns(reference[0])
+
+
+def test_failed_call_stops_the_program(make_proxy):
+    proxy = make_proxy()
+    with pytest.raises(BatchException, match="Call 1 \\(fail\\) of the program") as info:
+        with proxy.program() as program:
+            program.add(1)
+            program.fail("broken")
+            program.record("never")
+    assert info.value.results == [2]
+
+
+def test_program_as_job(make_proxy):
+    proxy = make_proxy()
+    program = proxy.program()
+    first = program.add(1)
+    program.add(first, step=first)
+    job = program.start_job()
+    assert job.result(timeout=5) == [2, 4]
+    assert program.results == [2, 4]
@@ -0,0 +1,54 @@
+"""
+Tests of the waiting for the end of a pulse test, in pylptlib and with polls by the server.
+"""
+import time
+
+import pytest
+
+from pylptlib import lpt, param
+from tcp_client.ProxyClass import RemoteException
+
+
+def fake_status(monkeypatch, statuses):
+    """Let lpt.pulse_exec_status return the given (status, elapsed_time) pairs, and log the calls of dev_abort."""
+    statuses = iter(statuses)
+    aborts = []
+    monkeypatch.setattr(lpt, "pulse_exec_status", lambda: next(statuses))
+    monkeypatch.setattr(lpt, "dev_abort", lambda: aborts.append(True))
+    return aborts
+
+
+def test_pulse_exec_wait_returns_final_status(monkeypatch):
+    running = param.PMU_TEST_STATUS_RUNNING
+    aborts = fake_status(monkeypatch, [(running, 0.0), (running, 0.001), (param.PMU_TEST_STATUS_IDLE, 0.002)])
+    assert lpt.pulse_exec_wait(timeout=1) == (param.PMU_TEST_STATUS_IDLE, 0.002)
+    assert not aborts
+
+
+def test_pulse_exec_wait_aborts_at_timeout(monkeypatch):
+    elapsed_times = (i * 0.01 for i in range(1000))
+    aborts = fake_status(monkeypatch, ((param.PMU_TEST_STATUS_RUNNING, t) for t in elapsed_times))
+    with pytest.raises(TimeoutError, match="aborted"):
+        lpt.pulse_exec_wait(timeout=0.05)
+    assert aborts == [True]
+
+
+def test_wait_while_returns_when_the_value_changes(make_proxy):
+    proxy = make_proxy()
+    proxy.pulse_exec(0.2)
+    start = time.perf_counter()
+    status, elapsed_time = proxy.wait_while(param.PMU_TEST_STATUS_RUNNING, "pulse_exec_status", item=0, timeout=5)
+    assert status == param.PMU_TEST_STATUS_IDLE
+    assert elapsed_time >= 0.2
+    # the polling interval grows with the waiting time, but stays short
+    assert time.perf_counter() - start < 0.5
+
+
+def test_wait_while_aborts_at_timeout(make_proxy):
+    proxy = make_proxy()
+    proxy.take_log()
+    proxy.pulse_exec(10)
+    with pytest.raises(RemoteException, match="TimeoutError"):
+        proxy.wait_while(param.PMU_TEST_STATUS_RUNNING, "pulse_exec_status", item=0, timeout=0.1, abort="dev_abort")
+    assert proxy.take_log() == ["dev_abort"]
+    assert proxy.pulse_exec_status()[0] == param.PMU_TEST_STATUS_IDLE
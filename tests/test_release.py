@@ -0,0 +1,63 @@
+"""
+Tests of the release of the objects that the server keeps for RemoteVars.
+"""
+import gc
+
+import pytest
+
+from conftest import remote_vars, send_command
+from tcp_client.ProxyClass import RemoteException
+
+
+def test_released_object_is_deleted_with_the_next_request(make_proxy):
+    proxy = make_proxy()
+    before = remote_vars(proxy)
+    kept = proxy.make_object()
+    released = proxy.make_object()
+    released.release()
+    proxy.flush_releases()
+    assert remote_vars(proxy) == before + 1
+    assert proxy.type_name(kept) == "SimpleNamespace"
+    with pytest.raises(RemoteException, match="released"):
+        proxy.type_name(released)
+
+
+def test_garbage_collected_remote_var_is_released(make_proxy):
+    proxy = make_proxy()
+    before = remote_vars(proxy)
+    proxy.make_object()
+    gc.collect()
+    proxy.flush_releases()
+    assert remote_vars(proxy) == before
+
+
+@pytest.mark.parametrize("kind", ["batch", "program"])
+def test_remote_var_argument_of_a_batch_is_kept_until_sent(make_proxy, kind):
+    proxy = make_proxy()
+    before = remote_vars(proxy)
+    with getattr(proxy, kind)() as batch:
+        # the RemoteVar is only referenced by the recorded call
+        batch.type_name(proxy.make_object())
+        gc.collect()
+    assert batch.results == ["SimpleNamespace"]
+    gc.collect()
+    proxy.flush_releases()
+    assert remote_vars(proxy) == before
+
+
+def test_remote_var_argument_of_a_batch_job_is_kept_until_sent(make_proxy):
+    proxy = make_proxy()
+    batch = proxy.batch()
+    batch.type_name(proxy.make_object())
+    gc.collect()
+    job = batch.start_job()
+    assert job.result(timeout=5) == ["SimpleNamespace"]
+
+
+def test_commands_without_class_are_rejected(port):
+    for command in ({"function": "add"}, {"attribute": "KI_INTGPLC"}, {"batch": []}, {"namespace": True}):
+        response = send_command(port, command)
+        assert response["status"] == "exception"
+        assert "class" in response["message"]
+    # commands that only release variables are answered with None
+    assert send_command(port, {"release": []})["return"]["value"] is None
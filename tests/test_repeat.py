@@ -0,0 +1,53 @@
+"""
+Tests of repeated calls of a function in a single request.
+"""
+import threading
+import time
+
+import pytest
+
+from conftest import send_command
+from tcp_client.ProxyClass import RemoteException
+
+
+def test_repeat_returns_values_and_host_times(make_proxy):
+    proxy = make_proxy()
+    before = time.time()
+    values, times = proxy.repeat("add", 50, 1, step=2)
+    assert values == [3] * 50
+    assert before <= times[0] <= times[-1] <= time.time()
+    assert times == sorted(times)
+    assert proxy.repeat("add", 0, 1) == ([], [])
+
+
+def test_invalid_number_of_repetitions(make_proxy):
+    proxy = make_proxy()
+    with pytest.raises(RemoteException, match="non-negative integer"):
+        proxy.repeat("add", -1, 1)
+
+
+def test_repeat_at_interval(make_proxy):
+    proxy = make_proxy()
+    values, times = proxy.repeat("add", 5, 1, interval=0.05)
+    assert values == [2] * 5
+    assert times[-1] - times[0] == pytest.approx(0.2, abs=0.04)
+
+
+def test_other_sessions_are_served_between_repetitions(make_proxy):
+    proxy = make_proxy()
+    other = make_proxy()
+    thread = threading.Thread(target=proxy.repeat, args=("add", 6, 1), kwargs={"interval": 0.2})
+    thread.start()
+    time.sleep(0.1)
+    start = time.perf_counter()
+    assert other.add(1) == 2
+    assert time.perf_counter() - start < 0.1
+    thread.join()
+
+
+def test_repeat_at_interval_is_not_run_as_job(port):
+    command = {"class": "lpt", "function": "add", "args": [{"type": "int", "value": 1}], "repeat": 3, "interval": 0.1,
+               "job": True}
+    response = send_command(port, command)
+    assert response["status"] == "exception"
+    assert "cannot be run as job" in response["message"]
@@ -0,0 +1,24 @@
+"""
+Tests of the tcp_server and the clients over TCP on the local computer, with the test server of conftest.
+"""
+import threading
+import time
+
+
+def test_served_functions_run_in_one_thread(make_proxy):
+    proxies = [make_proxy() for _ in range(3)]
+    assert len({proxy.thread_id() for proxy in proxies for _ in range(3)}) == 1
+
+
+def test_event_loop_is_not_blocked_by_a_running_call(make_proxy):
+    proxy = make_proxy()
+    other = make_proxy()
+    thread = threading.Thread(target=proxy.slow, args=(0.5,))
+    thread.start()
+    time.sleep(0.05)
+    start = time.perf_counter()
+    # attribute reads and metrics are answered by the event loop
+    assert other.KI_INTGPLC == 2
+    assert other.server_metrics()["queue_length"] == 0
+    assert time.perf_counter() - start < 0.2
+    thread.join()
@@ -0,0 +1,47 @@
+"""
+Tests of the Session that shares one connection between proxies and threads.
+"""
+import threading
+
+import pytest
+
+from tcp_client.ProxyClass import SyncProxyBase
+from tcp_client.SessionClass import Session
+
+
+def test_threads_share_one_connection(relay):
+    results = {}
+
+    def run(session: Session, index: int):
+        results[index] = [session.lpt.add(index * 100 + i) for i in range(20)]
+
+    with Session("127.0.0.1", relay.port) as session:
+        threads = [threading.Thread(target=run, args=(session, index)) for index in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert results == {index: [index * 100 + i + 1 for i in range(20)] for index in range(8)}
+    assert relay.connections == 1
+
+
+def test_target_returns_one_proxy_per_served_object(port):
+    with Session("127.0.0.1", port) as session:
+        assert session.target("lpt") is session.lpt
+        assert session.target("lpt", snapshot=True).KI_INTGPLC == 2
+        assert session.lpt.submit("add", 1).result() == 2
+
+
+def test_session_with_stubs(port):
+    with Session("127.0.0.1", port, stubs=True) as session:
+        assert session.lpt.add(1, step=2) == 3
+        with pytest.raises(TypeError):
+            session.lpt.add()
+
+
+def test_sync_proxy_needs_a_transport():
+    class IncompleteProxy(SyncProxyBase):
+        pass
+
+    with pytest.raises(TypeError):
+        IncompleteProxy()
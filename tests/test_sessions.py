@@ -0,0 +1,69 @@
+"""
+Tests of the sessions of several clients and of the fair scheduling of their calls.
+"""
+import threading
+import time
+
+import pytest
+
+from conftest import MEMORY_BUDGET, SESSION_TTL
+from tcp_client.ProxyClass import RemoteException
+
+
+def test_instrument_lock_holds_back_other_sessions(make_proxy):
+    owner = make_proxy()
+    other = make_proxy()
+    owner.take_log()
+    thread = threading.Thread(target=lambda: (time.sleep(0.05), other.record("other")))
+    with owner.instrument_lock():
+        thread.start()
+        owner.slow(0.1, "locked 1")
+        owner.slow(0.1, "locked 2")
+    thread.join()
+    assert owner.take_log() == ["locked 1", "locked 2", "other"]
+
+
+def test_sessions_are_served_round_robin(make_proxy):
+    busy = make_proxy()
+    other = make_proxy()
+    busy.take_log()
+    pending = [busy.submit("slow", 0.05, "busy") for _ in range(6)]
+    time.sleep(0.02)
+    other.record("other")
+    for call in pending:
+        call.result()
+    log = busy.take_log()
+    # the call of the other session waits at most for the running call and the one queued before it arrived
+    assert log.index("other") <= 2
+
+
+def test_memory_budget_is_shared_by_sessions(make_proxy):
+    proxies = [make_proxy() for _ in range(3)]
+    buffers = [proxy.make_buffer(400000) for proxy in proxies for _ in range(2)]
+    assert proxies[0].server_metrics()["remote_vars"]["memory"] <= MEMORY_BUDGET
+    # the least recently used buffers of the first sessions were evicted
+    with pytest.raises(RemoteException, match="evicted"):
+        proxies[0].add(buffers[0])
+    del buffers
+
+
+def test_idle_sessions_expire(make_proxy):
+    proxy = make_proxy()
+    objects = [proxy.make_object() for _ in range(3)]
+    sessions = proxy.server_metrics()["sessions"]
+    proxy.close()
+    time.sleep(SESSION_TTL + 0.2)
+    # a new session lets the server discard the expired ones
+    metrics = make_proxy().server_metrics()
+    assert metrics["sessions"] <= sessions
+    with pytest.raises(RemoteException, match="unknown"):
+        proxy.add(objects[0])
+
+
+def test_sessions_do_not_share_objects(make_proxy):
+    owner = make_proxy()
+    other = make_proxy()
+    obj = owner.make_object()
+    assert owner.type_name(obj) == "SimpleNamespace"
+    with pytest.raises(RemoteException, match="unknown"):
+        other.type_name(obj)
@@ -0,0 +1,24 @@
+"""
+Tests of the snapshot of the constants of a served object.
+"""
+from conftest import send_command
+
+
+def test_namespace_contains_only_public_constants(port):
+    namespace = send_command(port, {"class": "lpt", "namespace": True})["return"]
+    assert namespace == {
+        "KI_INTGPLC": {"type": "int", "value": 2},
+        "NAME": {"type": "str", "value": "fake"},
+        "PI": {"type": "float", "value": 3.14},
+    }
+
+
+def test_snapshot_is_read_without_requests(make_proxy, relay):
+    proxy = make_proxy(port=relay.port, snapshot=True)
+    relay.close()
+    assert (proxy.KI_INTGPLC, proxy.PI, proxy.NAME) == (2, 3.14, "fake")
+
+
+def test_functions_are_not_part_of_the_snapshot(make_proxy):
+    proxy = make_proxy(snapshot=True)
+    assert proxy.add(1) == 2
@@ -0,0 +1,60 @@
+"""
+Tests of the streaming of results in chunks, with the test server of conftest.
+"""
+import asyncio
+import time
+
+import pytest
+
+from tcp_client.AsyncProxyClass import AsyncProxy
+
+
+def test_other_calls_during_stream_raise(make_proxy):
+    proxy = make_proxy()
+    stream = proxy.stream("floats", 2000, chunk_size=10)
+    assert next(stream) == [i * 0.001 for i in range(10)]
+    with pytest.raises(RuntimeError):
+        proxy.add(1)
+    assert sum(1 for _ in stream) == 199
+    assert proxy.add(1) == 2
+
+
+def test_stopped_stream_closes_generator(make_proxy):
+    proxy = make_proxy()
+    closed = proxy.closed_generators()
+    stream = proxy.stream("generate", 100000)
+    next(stream)
+    stream.close()
+    assert proxy.add(1) == 2
+    time.sleep(0.1)
+    assert proxy.closed_generators() == closed + 1
+
+
+def test_async_stream_allows_other_calls_in_between(port):
+    async def run():
+        async with AsyncProxy("127.0.0.1", port, "lpt") as proxy:
+            chunks = []
+            sums = []
+            async for chunk in proxy.stream("floats", 2000, chunk_size=10):
+                chunks.append(chunk)
+                # would wait forever for a response behind the chunks on the connection of the stream
+                sums.append(await asyncio.wait_for(proxy.add(len(chunks)), 5))
+            return chunks, sums
+
+    chunks, sums = asyncio.run(run())
+    assert [value for chunk in chunks for value in chunk] == [i * 0.001 for i in range(2000)]
+    assert sums == list(range(2, 202))
+
+
+def test_stopped_async_stream_closes_generator(port):
+    async def run():
+        async with AsyncProxy("127.0.0.1", port, "lpt") as proxy:
+            closed = await proxy.closed_generators()
+            stream = proxy.stream("generate", 100000)
+            await stream.__anext__()
+            await stream.aclose()
+            assert await proxy.add(1) == 2
+            await asyncio.sleep(0.1)
+            return await proxy.closed_generators() - closed
+
+    assert asyncio.run(run()) == 1
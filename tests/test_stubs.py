@@ -0,0 +1,62 @@
+"""
+Tests of the stubs created from the schema of the served functions.
+"""
+import asyncio
+import inspect
+
+import pytest
+
+from conftest import send_command
+from tcp_client.AsyncProxyClass import AsyncProxy
+from tcp_client.ProxyClass import check_arguments
+
+
+def test_schema_describes_the_public_functions(port):
+    schema = send_command(port, {"schema": True})["return"]["lpt"]
+    assert "_private" not in schema["functions"]
+    add = schema["functions"]["add"]
+    assert add["doc"] == "Return value + step."
+    assert add["return_annotation"] == "int"
+    assert add["parameters"] == [
+        {"name": "value", "kind": "POSITIONAL_OR_KEYWORD", "annotation": "int"},
+        {"name": "step", "kind": "POSITIONAL_OR_KEYWORD", "annotation": "int", "default": "1"},
+    ]
+    assert schema["constants"]["KI_INTGPLC"] == {"type": "int", "value": 2}
+
+
+def test_stubs_have_the_signatures_of_the_served_functions(make_proxy):
+    proxy = make_proxy(stubs=True)
+    signature = inspect.signature(proxy.add)
+    assert list(signature.parameters) == ["value", "step"]
+    assert repr(signature.parameters["step"].default) == "1"
+    assert signature.return_annotation == "int"
+    assert proxy.add.__doc__ == "Return value + step."
+    assert proxy.add(1, step=2) == 3
+    assert proxy.KI_INTGPLC == 2
+
+
+def test_stubs_check_the_arguments_before_sending(make_proxy, relay):
+    proxy = make_proxy(port=relay.port, stubs=True)
+    relay.close()
+    with pytest.raises(TypeError, match="add\\(\\)"):
+        proxy.add()
+    with pytest.raises(TypeError, match="add\\(\\)"):
+        proxy.add(1, size=2)
+
+
+def test_functions_without_signature_are_not_checked():
+    check_arguments("builtin", None, (1, 2, 3), {"any": True})
+
+
+def test_async_proxy_with_stubs(port):
+    async def run():
+        proxy = AsyncProxy("127.0.0.1", port, "lpt")
+        await proxy.load_stubs()
+        try:
+            with pytest.raises(TypeError):
+                await proxy.add()
+            return await proxy.add(1, 2)
+        finally:
+            await proxy.close()
+
+    assert asyncio.run(run()) == 3
@@ -0,0 +1,97 @@
+"""
+Measure the processing time of the tcp_server per request, without the network.
+
+    python tools/benchmark_dispatch.py [--requests 20000] [--json]
+
+The commands are executed with Server.run_command against a fake lpt module, so the times only contain parsing,
+dispatch, conversion of the arguments and results, and serialization. If orjson is installed, each command is
+measured with and without it.
+"""
+import argparse
+import functools
+import json
+import sys
+import time
+import types
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "tcp_server"))
+
+import server as server_module  # noqa: E402
+
+
+def make_fake_lpt() -> types.ModuleType:
+    lpt = types.ModuleType("lpt")
+    lpt.KI_INTGPLC = 2
+
+    def intgi(instr_id: int) -> float:
+        return 1.5e-9
+
+    def forcev(instr_id: int, value: float) -> None:
+        return None
+
+    # the waveforms are generated once per length, so that only the transfer is measured
+    @functools.lru_cache(maxsize=8)
+    def waveform(points: int):
+        return [0.5] * points, [1e-6] * points, [1e-8 * i for i in range(points)], [0] * points
+
+    def pulse_fetch(instr_id: int, chan: int, start_index: int, stop_index: int):
+        return waveform(stop_index - start_index + 1)
+
+    lpt.intgi = intgi
+    lpt.forcev = forcev
+    lpt.pulse_fetch = pulse_fetch
+    return lpt
+
+
+def value(arg) -> dict:
+    return {"type": type(arg).__name__, "value": arg}
+
+
+COMMANDS = {
+    "attribute": {"class": "lpt", "attribute": "KI_INTGPLC", "id": 1},
+    "intgi": {"class": "lpt", "function": "intgi", "args": [value(1)], "kwargs": {}, "packed": True, "id": 1},
+    "forcev": {"class": "lpt", "function": "forcev", "args": [value(1), value(0.1)], "kwargs": {}, "packed": True,
+               "id": 1},
+    "pulse_fetch_100": {"class": "lpt", "function": "pulse_fetch",
+                        "args": [value(1), value(1), value(0), value(99)], "kwargs": {}, "packed": True, "id": 1},
+}
+
+
+def measure(server, command: str, requests: int) -> float:
+    """Return the mean time per request in seconds."""
+    for _ in range(requests // 10):
+        server.run_command(command)
+    start = time.perf_counter()
+    for _ in range(requests):
+        server.run_command(command)
+    return (time.perf_counter() - start) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000, help="number of requests per command")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    options = parser.parse_args()
+
+    server = server_module.Server({"lpt": make_fake_lpt()})
+    codecs = ["json"]
+    if getattr(server_module, "orjson_imported", False):
+        codecs.append("orjson")
+
+    results = {}
+    for codec in codecs:
+        server_module.orjson_imported = codec == "orjson"
+        for name, command in COMMANDS.items():
+            results[f"{name} ({codec})"] = measure(server, json.dumps(command), options.requests)
+    server_module.orjson_imported = "orjson" in codecs
+
+    if options.json:
+        print(json.dumps({name: seconds * 1e6 for name, seconds in results.items()}))
+    else:
+        for name, seconds in results.items():
+            print(f"{name:<30} {seconds * 1e6:8.2f} us/request")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Measure the throughput and latency of the tcp_server over TCP on the local computer.
+
+    python tools/benchmark_server.py [--duration 2] [--clients 1 4] [--points 1000 100000] [--framing line length]
+                                     [--json]
+
+The server is started with run_server in a subprocess and serves the fake lpt module of benchmark_dispatch, so the
+results contain the whole remote path (conversion on the client, network, dispatch and serialization on the server),
+but no time spent in the DLL. The scenarios are scalar calls (intgi), attribute reads (KI_INTGPLC) and pulse_fetch
+with each of the given numbers of points. Every scenario is run with each framing and number of concurrent clients,
+each client in its own process with its own connection, for the given duration in seconds.
+
+Reported are the calls per second of all clients together, the 50th and 99th percentile of the latencies of the
+single calls and the received bytes per second. With --json, the options and results are printed as one JSON object
+for regression tracking.
+"""
+import argparse
+import json
+import multiprocessing
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "tcp_server"))
+
+from benchmark_dispatch import make_fake_lpt  # noqa: E402
+from tcp_client.ProxyClass import Proxy  # noqa: E402
+
+
+def serve(port: int):
+    import server as server_module
+    server_module.run_server("127.0.0.1", port, {"lpt": make_fake_lpt()})
+
+
+def start_server() -> Tuple[subprocess.Popen, int]:
+    """Start the server in a subprocess on a free port and wait until it accepts connections."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    process = subprocess.Popen([sys.executable, __file__, "--serve", str(port)], stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return process, port
+        except OSError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                raise RuntimeError("The server could not be started.")
+            time.sleep(0.05)
+
+
+def make_call(proxy: Proxy, scenario: str):
+    if scenario == "scalar":
+        return lambda: proxy.intgi(1)
+    if scenario == "attribute":
+        # attributes that are no functions are requested from the server on every access
+        return lambda: proxy.KI_INTGPLC
+    points = int(scenario.rsplit("_", 1)[1])
+    return lambda: proxy.pulse_fetch(1, 1, 0, points - 1)
+
+
+def run_client(port: int, scenario: str, framing: str, duration: float, barrier, results):
+    proxy = Proxy("127.0.0.1", port, "lpt", framing=framing)
+    call = make_call(proxy, scenario)
+    # the first call opens the connection
+    call()
+    # the sizes of all following requests and responses are added to this trace by the proxy
+    trace = {"serialize": 0.0, "network": 0.0, "deserialize": 0.0, "request_bytes": 0, "response_bytes": 0}
+    proxy._trace = trace
+    latencies = []
+    barrier.wait()
+    start = time.perf_counter()
+    end = start + duration
+    while True:
+        call_start = time.perf_counter()
+        call()
+        call_end = time.perf_counter()
+        latencies.append(call_end - call_start)
+        if call_end >= end:
+            break
+    results.put({"latencies": latencies, "elapsed": call_end - start, "bytes": trace["response_bytes"]})
+    proxy.close()
+
+
+def measure(port: int, scenario: str, framing: str, clients: int, duration: float) -> dict:
+    barrier = multiprocessing.Barrier(clients)
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=run_client, args=(port, scenario, framing, duration, barrier, results))
+                 for _ in range(clients)]
+    for process in processes:
+        process.start()
+    client_results = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    latencies = sorted(latency for result in client_results for latency in result["latencies"])
+    elapsed = max(result["elapsed"] for result in client_results)
+
+    def percentile(fraction: float) -> float:
+        return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))]
+
+    return {
+        "scenario": scenario,
+        "framing": framing,
+        "clients": clients,
+        "calls": len(latencies),
+        "calls_per_second": len(latencies) / elapsed,
+        "p50": percentile(0.5),
+        "p99": percentile(0.99),
+        "bytes_per_second": sum(result["bytes"] for result in client_results) / elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=2.0, help="seconds per scenario")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 4], help="numbers of concurrent clients")
+    parser.add_argument("--points", type=int, nargs="+", default=[1000, 100000],
+                        help="numbers of points of the pulse_fetch scenarios")
+    parser.add_argument("--framing", nargs="+", default=["line", "length"], choices=["line", "length"])
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    options = parser.parse_args()
+
+    if options.serve is not None:
+        serve(options.serve)
+        return
+
+    scenarios = ["scalar", "attribute", *(f"pulse_fetch_{points}" for points in options.points)]
+    process, port = start_server()
+    results = []
+    try:
+        for scenario in scenarios:
+            for framing in options.framing:
+                for clients in options.clients:
+                    result = measure(port, scenario, framing, clients, options.duration)
+                    results.append(result)
+                    if not options.json:
+                        print(f"{scenario:<20} {framing:<7} {clients:>3} clients {result['calls_per_second']:10.1f} "
+                              f"calls/s  p50 {result['p50'] * 1e3:8.3f} ms  p99 {result['p99'] * 1e3:8.3f} ms  "
+                              f"{result['bytes_per_second'] / 2 ** 20:8.2f} MiB/s")
+    finally:
+        process.terminate()
+        process.wait()
+
+    if options.json:
+        print(json.dumps({
+            "options": {key: value for key, value in vars(options).items() if key not in ("json", "serve")},
+            "results": results,
+        }))
+
+
+if __name__ == "__main__":
+    main()